@@ -0,0 +1,1286 @@
+import os
+import sys
+import re
+import time
+import json
+import uuid
+import asyncio
+import shutil
+import zipfile
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 导入项目相关模块
+sys.path.append('.')
+
+from template.simpleTemplate import (
+    SCORE_ONE, SUMMARY_SCORE, ABC_ONE, SUMMARY_ABC, BATCH_SCORE, BATCH_ABC, JSON_OUTPUT, REASK_ONE
+)
+
+# 从tools模块导入所有必要组件
+from tools.llm import LLMClientRegistry, DEFAULT_MAX_CONNECTIONS, DEFAULT_TIMEOUT
+from tools.llm_cache import LLMResponseCache
+from tools.journal import GradingJournal
+from tools.get_files import read_source_files
+from tools.get_content import decode_submission
+from tools.group_files import assign_files_by_question, merge_groups, create_default_groups
+from tools.grouping_cache import GroupingCache
+from tools.local_grouping import group_files_locally
+from tools.dedup import SubmissionDeduplicator
+from tools.rate_limit import RequestThrottle
+from tools.tokens import estimate_message_tokens, fit_groups_to_budget
+from tools.file_processor import extract_student_info
+from tools.metrics import StageTimer, TokenUsage, STUDENTS_TOTAL
+from tools.result_writer import ResultStreamWriter, CSV_FIELDS, OUTPUT_FORMATS, csv_row, merge_record_files
+from preprocessor.manifest import build_manifest, save_manifest, load_manifest, materialize
+
+# 配置
+PROCESSED_ZIPS_DIR = 'collected_zips'
+DEFAULT_MAX_WORKERS = 4
+LLM_CACHE_PATH = 'llm_cache.sqlite3'
+RUNS_DIR = 'runs'
+GRADING_MODES = ('per_question', 'stream', 'batch')
+# 运行ID用作 runs/ 下的文件名，只允许字母、数字、下划线和连字符
+RUN_ID_PATTERN = re.compile(r'[A-Za-z0-9_\-]+')
+# 各阶段单次请求的提示词token预算，超出时压缩或截断代码
+TOKEN_BUDGETS = {
+    "single": 16000,
+    "summary": 12000,
+    "batch": 24000
+}
+SYSTEM_PROMPT = "你是一个专业的C++编程老师，善于批改学生作业。"
+# 追问缺少字段时只需要一行结论
+REASK_MAX_TOKENS = 64
+# 单题评分的标准格式 [<question>题号</question>,<score>分数</score>]
+GRADING_TAG_PATTERN = re.compile(r'\[<question>(-?\d+)</question>\s*[,，]\s*<score>([A-Za-z0-9]+)</score>\]')
+
+def shard_of(path, num_shards):
+    """
+    ZIP文件所属的分片
+
+    按相对路径的CRC32取模，与文件的发现顺序和运行所在的机器无关，
+    同一目录在任意进程中得到相同的划分。
+    """
+    return zlib.crc32(path.replace(os.sep, '/').encode('utf-8')) % num_shards
+
+def process_homework_workflow(search_dir, requirements, num_questions, assignment_type, base_url, model_name, api_key,
+                              max_workers=DEFAULT_MAX_WORKERS, use_cache=False, run_id=None,
+                              grading_mode='per_question', requests_per_minute=None, tokens_per_minute=None,
+                              shard=None, output_file=None, output_formats=('csv',), structured_output=False,
+                              llm_max_connections=DEFAULT_MAX_CONNECTIONS, llm_timeout=DEFAULT_TIMEOUT):
+    """
+    处理作业的完整流程：合并ZIP文件，然后批改
+    
+    Args:
+        search_dir: 包含学生作业ZIP文件的目录
+        requirements: 作业要求
+        num_questions: 题目数量
+        assignment_type: 作业类型
+        base_url: LLM API基础URL
+        model_name: 模型名称
+        api_key: API密钥
+        max_workers: 同时批改的学生数量
+        use_cache: 是否启用持久化的LLM响应缓存，重跑时相同请求直接复用结果
+        run_id: 运行ID，为None时新建；使用已有的运行ID重跑时跳过日志中已批改完成的学生
+        grading_mode: 批改方式，per_question 为每题单独调用LLM再生成总结，
+            stream 与 per_question 相同但流式接收单题评分、收到评分标签即停止，
+            batch 为一次调用完成所有题目的批改和总结
+        requests_per_minute: 每分钟LLM请求数上限，None表示不限制
+        tokens_per_minute: 每分钟LLM token数上限，None表示不限制
+        shard: (分片序号, 分片总数)，只批改属于该分片的ZIP文件，None表示全部批改
+        output_file: 结果CSV文件名，None时按时间戳生成
+        output_formats: 输出格式，可选 csv、jsonl、parquet；jsonl 和 parquet 包含每题得分，
+            与CSV同名、扩展名不同。每名学生完成后立即追加写入
+        structured_output: 单题评分是否使用JSON输出模式（response_format），解析仍回退到正则匹配
+        llm_max_connections: 本次运行共享的LLM连接池的最大连接数
+        llm_timeout: 单次LLM请求的超时（秒）
+        
+    Yields:
+        JSON格式的进度更新信息
+    """
+    import os
+    import csv
+    import sys
+    
+    # 强制 stdout 使用 UTF-8
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+    
+    # 每次运行写入断点日志，使用相同的运行ID可以从中断处继续
+    if not run_id:
+        run_id = time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    if shard is not None:
+        # 各分片使用独立的日志和临时目录，可以在不同进程或机器上同时运行
+        run_id = f"{run_id}_shard{shard[0]}of{shard[1]}"
+    journal = GradingJournal(RUNS_DIR, run_id)
+    completed = journal.load()
+    
+    yield json.dumps({
+        "type": "info",
+        "message": f"运行ID: {run_id}",
+        "run_id": run_id
+    }, ensure_ascii=False) + "\n"
+    
+    # 各阶段耗时，随最终结果返回并计入 /metrics
+    timer = StageTimer()
+    
+    # 作业直接从原目录读取，只有文件头需要修复的ZIP才写入本次运行的临时目录
+    temp_output_dir = os.path.join(PROCESSED_ZIPS_DIR, run_id)
+    shutil.rmtree(temp_output_dir, ignore_errors=True)
+    
+    yield json.dumps({
+        "type": "info",
+        "message": f"开始扫描ZIP文件，搜索目录: {search_dir}"
+    }, ensure_ascii=False) + "\n"
+    
+    from preprocessor.merge_zip import find_all_zip_files
+    
+    with timer.span("find_zips"):
+        zip_files = sorted(find_all_zip_files(search_dir))
+    
+    yield json.dumps({
+        "type": "info",
+        "message": f"在 {search_dir} 中找到 {len(zip_files)} 个ZIP文件"
+    }, ensure_ascii=False) + "\n"
+    
+    if shard is not None:
+        zip_files = [path for path in zip_files if shard_of(os.path.relpath(path, search_dir), shard[1]) == shard[0]]
+        yield json.dumps({
+            "type": "info",
+            "message": f"分片 {shard[0]}/{shard[1]}：本分片负责 {len(zip_files)} 个ZIP文件"
+        }, ensure_ascii=False) + "\n"
+    
+    # 生成提交清单：记录每份作业的路径、大小、修改时间、文件头偏移和学生信息，
+    # 重跑时未变化的文件复用上次的扫描结果
+    manifest_path = os.path.join(RUNS_DIR, f"{run_id}.manifest.json")
+    with timer.span("manifest"):
+        manifest = build_manifest(zip_files, previous=load_manifest(manifest_path))
+        save_manifest(manifest, manifest_path)
+    
+    needs_repair = [entry for entry in manifest if entry["zip_offset"] > 0]
+    with timer.span("repair_zips"):
+        zip_paths = {entry["name"]: entry["path"] for entry in manifest}
+        if needs_repair:
+            with ThreadPoolExecutor(max_workers=max_workers) as repair_executor:
+                repaired = repair_executor.map(lambda entry: materialize(entry, temp_output_dir), needs_repair)
+                for entry, path in zip(needs_repair, repaired):
+                    zip_paths[entry["name"]] = path
+    
+    yield json.dumps({
+        "type": "info",
+        "message": f"ZIP文件扫描完成，共 {len(manifest)} 份作业，其中 {len(needs_repair)} 份需要修复文件头，"
+                   f"{sum(1 for entry in manifest if entry['zip_offset'] < 0)} 份找不到ZIP文件头"
+    }, ensure_ascii=False) + "\n"
+
+    # 根据作业类型选择模板
+    if assignment_type == "实验":
+        templates = {
+            "single": SCORE_ONE,
+            "summary": SUMMARY_SCORE,
+            "batch": BATCH_SCORE
+        }
+    elif assignment_type == "理论":
+        templates = {
+            "single": ABC_ONE,
+            "summary": SUMMARY_ABC,
+            "batch": BATCH_ABC
+        }
+    else:
+        yield json.dumps({
+            "type": "error",
+            "message": f"未知的作业类型: {assignment_type}"
+        }, ensure_ascii=False) + "\n"
+        return
+
+    cache = LLMResponseCache(LLM_CACHE_PATH) if use_cache else None
+    # 识别不同学生之间相同的作业分组，只批改一次
+    dedup = SubmissionDeduplicator()
+    # 目录结构相同的提交复用同一个LLM分组结果
+    grouping_cache = GroupingCache()
+    # 所有LLM请求共享限速、自适应并发和退避重试，被限流时不会丢失成绩
+    throttle = RequestThrottle(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    # 本次运行所有LLM调用的token用量，包括命中服务端上下文缓存的提示词token
+    token_usage = TokenUsage()
+    
+    # 按清单顺序（ZIP文件相对路径的顺序）批改，多进程合并时使用相同的顺序
+    zip_files = [entry["name"] for entry in manifest]
+    # 断点日志和结果文件以相对于搜索目录的路径标识每份作业
+    entries = {entry["name"]: entry for entry in manifest}
+    relative_paths = {name: os.path.relpath(entry["path"], search_dir) for name, entry in entries.items()}
+    results = [None] * len(zip_files)
+    
+    yield json.dumps({
+        "type": "info",
+        "message": f"开始批改作业，共有 {len(zip_files)} 份作业，并发数: {max_workers}"
+    }, ensure_ascii=False) + "\n"
+    
+    # 结果随批改进度逐个写入，运行中途即可查看已完成学生的成绩
+    if not output_file:
+        output_file = f"grading_results_{int(time.time())}.csv"
+    try:
+        writer = ResultStreamWriter(output_file, output_formats)
+    except (ValueError, OSError) as e:
+        yield json.dumps({
+            "type": "error",
+            "message": f"无法创建结果文件: {str(e)}"
+        }, ensure_ascii=False) + "\n"
+        return
+    
+    # 分组、评分和总结共享同一个客户端和保持连接的连接池
+    try:
+        clients = LLMClientRegistry(
+            api_key=api_key, base_url=base_url, model_name=model_name, cache=cache, throttle=throttle,
+            usage=token_usage, max_connections=llm_max_connections, timeout=llm_timeout
+        )
+    except ValueError as e:
+        writer.close()
+        yield json.dumps({
+            "type": "error",
+            "message": str(e)
+        }, ensure_ascii=False) + "\n"
+        return
+    
+    # 文件大小和修改时间都未变时才跳过
+    pending = []
+    for i, zip_file in enumerate(zip_files):
+        entry = entries[zip_file]
+        record = completed.get(relative_paths[zip_file])
+        if GradingJournal.matches(record, entry["size"], entry["mtime"]):
+            results[i] = record["result"]
+            writer.write(zip_file, results[i], relative_paths[zip_file])
+        else:
+            pending.append(i)
+    if len(pending) < len(zip_files):
+        yield json.dumps({
+            "type": "info",
+            "message": f"已有 {len(zip_files) - len(pending)} 份作业在本运行ID中批改完成且文件未变化，将跳过"
+        }, ensure_ascii=False) + "\n"
+    
+    # 并发批改：每个学生的事件在其完成后整体输出，保证同一学生的事件顺序不被打乱
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    grading_started = time.perf_counter()
+    try:
+        futures = {
+            executor.submit(
+                collect_events,
+                grade_student(
+                    i, len(zip_files), zip_paths[zip_files[i]],
+                    requirements, num_questions, assignment_type, templates, clients,
+                    grading_mode=grading_mode, dedup=dedup, grouping_cache=grouping_cache, zip_name=zip_files[i],
+                    structured_output=structured_output
+                )
+            ): i
+            for i in pending
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                events, result = future.result()
+            except Exception as e:
+                # 单个学生出错不影响其他学生的批改
+                student_id, student_name = extract_student_info(zip_files[i])
+                events = [json.dumps({
+                    "type": "error",
+                    "message": f"批改 {zip_files[i]} 时出错: {str(e)}"
+                }, ensure_ascii=False) + "\n"]
+                result = {
+                    "student_id": student_id,
+                    "student_name": student_name,
+                    "score": -1,
+                    "feedback": f"批改失败: {str(e)}"
+                }
+                STUDENTS_TOTAL.inc(outcome="error")
+            else:
+                # 出错的学生不写入日志，重跑时会重新批改
+                entry = entries[zip_files[i]]
+                journal.append(relative_paths[zip_files[i]], entry["size"], entry["mtime"], result)
+                STUDENTS_TOTAL.inc(outcome="ok")
+            writer.write(zip_files[i], result, relative_paths[zip_files[i]])
+            for event in events:
+                yield event
+            results[i] = result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        clients.close()
+        writer.close()
+        timer.record("grade_all", time.perf_counter() - grading_started)
+    
+    # 按学生顺序重写CSV
+    with timer.span("save_results"):
+        writer.finalize(results)
+    print(f"评分结果已保存至 {output_file}")
+    
+    # 清理修复时生成的zip文件
+    try:
+        if os.path.isdir(temp_output_dir):
+            with timer.span("cleanup"):
+                shutil.rmtree(temp_output_dir)
+            yield json.dumps({
+                "type": "info",
+                "message": f"已清理临时文件目录: {temp_output_dir}"
+            }, ensure_ascii=False) + "\n"
+    except Exception as e:
+        yield json.dumps({
+            "type": "warning",
+            "message": f"清理临时文件目录失败: {str(e)}"
+        }, ensure_ascii=False) + "\n"
+    
+    grouping_stats = Counter(result.get("grouping") for result in results if result)
+    yield json.dumps({
+        "type": "info",
+        "message": f"文件分组统计：本地分组 {grouping_stats['local']} 份，LLM分组 {grouping_stats['llm']} 份，"
+                   f"复用相同目录结构的分组 {grouping_stats['layout_cache']} 份"
+    }, ensure_ascii=False) + "\n"
+    
+    cache_stats = None
+    if cache is not None:
+        cache_stats = cache.stats()
+        cache.close()
+    
+    tokens = token_usage.to_dict()
+    if tokens["calls"]:
+        yield json.dumps({
+            "type": "info",
+            "message": f"token用量：提示词 {tokens['prompt_tokens']}（其中命中上下文缓存 {tokens['cached_tokens']}，"
+                       f"占 {tokens['cached_ratio']:.1%}），输出 {tokens['completion_tokens']}"
+                       + (f"；其中 {tokens['estimated_calls']} 次提前停止的流式调用没有返回用量，按估算值计入"
+                          if tokens["estimated_calls"] else "")
+        }, ensure_ascii=False) + "\n"
+    
+    yield json.dumps({
+        "type": "success",
+        "message": f"批改完成！共处理 {len(results)} 份作业，结果已保存至 {output_file}",
+        "results_count": len(results),
+        "output_file": output_file,
+        "outputs": writer.paths,
+        "run_id": run_id,
+        "grouping": {"local": grouping_stats["local"], "llm": grouping_stats["llm"],
+                     "layout_cache": grouping_stats["layout_cache"]},
+        "grouping_cache": grouping_cache.stats(),
+        "duplicates": sum(1 for result in results if result and result.get("duplicates")),
+        "throttle": throttle.stats(),
+        "cache": cache_stats,
+        "tokens": tokens,
+        "timings": timer.to_dict()
+    }, ensure_ascii=False) + "\n"
+
+
+def grade_student(index, total, zip_path, requirements, num_questions, assignment_type,
+                  templates, clients, grading_mode='per_question', dedup=None, zip_name=None,
+                  structured_output=False, grouping_cache=None):
+    """
+    批改单个学生的作业
+
+    以生成器形式产出该学生的进度事件，生成器的返回值为该学生的评分结果。
+    源文件直接从ZIP读入内存，不共享任何磁盘目录，因此可以在多个线程中并发调用。
+
+    Args:
+        index: 作业序号（从0开始）
+        total: 作业总数
+        zip_path: 学生作业ZIP文件路径
+        requirements: 作业要求
+        num_questions: 题目数量
+        assignment_type: 作业类型
+        templates: 单题评分模板与总结模板
+        clients: 本次运行共享的 LLMClientRegistry，分组、评分和总结都通过它调用LLM
+        grading_mode: 批改方式，per_question、stream 或 batch
+        dedup: 可选的 SubmissionDeduplicator，与其他学生相同的分组复用其批改结果
+        zip_name: 提交清单中的文件名，用于显示和提取学生信息，默认为 zip_path 的文件名
+        structured_output: 单题评分是否使用JSON输出模式
+        grouping_cache: 可选的 GroupingCache，目录结构与其他学生相同时复用其LLM分组结果
+
+    Yields:
+        JSON格式的进度更新信息
+
+    Returns:
+        评分结果字典
+    """
+    zip_file = zip_name or os.path.basename(zip_path)
+    timer = StageTimer()
+
+    yield json.dumps({
+        "type": "info", 
+        "message": f"正在处理第 {index+1}/{total} 份作业: {zip_file}"
+    }, ensure_ascii=False) + "\n"
+    
+    # 提取学号和姓名
+    student_id, student_name = extract_student_info(zip_file)
+    yield json.dumps({
+        "type": "info",
+        "message": f"学号: {student_id}, 姓名: {student_name}"
+    }, ensure_ascii=False) + "\n"
+    
+    # 检查是否是有效的zip文件
+    if not zipfile.is_zipfile(zip_path):
+        yield json.dumps({
+            "type": "warning",
+            "message": f"警告: {zip_file} 不是一个有效的ZIP文件，跳过处理"
+        }, ensure_ascii=False) + "\n"
+        return {
+            "student_id": student_id,
+            "student_name": student_name,
+            "score": -1,
+            "feedback": "无效的ZIP文件"
+        }
+        
+    # 直接从ZIP中读取源文件内容，不解压到磁盘
+    try:
+        with timer.span("read_zip"):
+            files = read_source_files(zip_path)
+        yield json.dumps({
+            "type": "info",
+            "message": f"已读取 {len(files)} 个源文件"
+        }, ensure_ascii=False) + "\n"
+    except Exception as e:
+        try:
+            error_msg = str(e)
+        except UnicodeError:
+            error_msg = repr(e)
+        
+        if isinstance(error_msg, str):
+            try:
+                error_msg.encode(sys.stdout.encoding or 'utf-8', errors='replace')
+            except Exception:
+                error_msg = error_msg.encode('utf-8', errors='replace').decode('utf-8')
+        
+        yield json.dumps({
+            "type": "error",
+            "message": f"提取文件失败: {error_msg}"
+        }, ensure_ascii=False) + "\n"
+        return {
+            "student_id": student_id,
+            "student_name": student_name,
+            "score": -1,
+            "feedback": f"提取文件失败: {error_msg}"
+        }
+    
+    # 使用ZIP内的相对路径作为键，而不是仅文件名
+    with timer.span("decode"):
+        decoded, encodings = decode_submission(files)
+    contents = {file_path: content for file_path, content in decoded.items() if content}
+    for file_path in decoded:
+        if file_path not in contents:
+            yield json.dumps({
+                "type": "warning",
+                "message": f"读取文件内容失败: {file_path}"
+            }, ensure_ascii=False) + "\n"
+    encoding_counts = Counter(encodings[file_path] for file_path in contents)
+    if set(encoding_counts) - {"utf-8"}:
+        yield json.dumps({
+            "type": "info",
+            "message": "源文件编码: " + "，".join(f"{encoding} {count} 个" for encoding, count in encoding_counts.items()),
+            "encodings": dict(encoding_counts)
+        }, ensure_ascii=False) + "\n"
+    
+    # 先根据 main/#include 依赖和目录结构在本地分组，无法唯一确定时再调用LLM分组
+    with timer.span("grouping"):
+        grouped = group_files_locally(contents, num_questions)
+        if grouped is not None:
+            grouping = "local"
+        else:
+            def assign():
+                return assign_files_by_question(contents, requirements, llm=clients.llm())
+
+            if grouping_cache is not None:
+                assignment, hit = grouping_cache.get_or_compute(contents.keys(), assign)
+            else:
+                assignment, hit = assign(), False
+            # LLM分组失败时每个文件独立成组
+            grouped = merge_groups(assignment, contents) if assignment is not None else create_default_groups(contents)
+            grouping = "layout_cache" if hit else "llm"
+    contents = grouped
+    grouping_label = {"local": "本地分析", "llm": "LLM", "layout_cache": "复用相同目录结构的分组"}[grouping]
+    yield json.dumps({
+        "type": "info",
+        "message": f"文件分组完成（{grouping_label}），共 {len(contents)} 组",
+        "grouping": grouping,
+        "grouping_cache_hit": grouping == "layout_cache"
+    }, ensure_ascii=False) + "\n"
+    
+    # 初始化自定义LLM（用于生成总结）
+    llm = clients.llm()
+    
+    # 登记每个分组的内容，找出与其他同学提交相同的分组
+    owner = f"{student_name}({student_id})"
+    claims = {key: dedup.claim(value, owner) for key, value in contents.items()} if dedup is not None else {}
+    graded = {}
+    try:
+        duplicates = {
+            key: first_owner for key, (_, first_owner) in claims.items()
+            if first_owner is not None and first_owner != owner
+        }
+        if duplicates:
+            yield json.dumps({
+                "type": "warning",
+                "message": f"有 {len(duplicates)} 组与其他同学的提交相同: " +
+                           "，".join(f"{key} 同 {first_owner}" for key, first_owner in duplicates.items())
+            }, ensure_ascii=False) + "\n"
+        
+        if grading_mode == "batch":
+            # 合并批改时各组一起评分，不复用结果，只标记重复
+            # 一次调用完成所有题目的批改和总结
+            batch_groups = fit_groups_to_budget(
+                contents, code_token_budget("batch", templates["batch"], requirements=requirements, groups="")
+            )
+            with timer.span("batch"):
+                scores, llm_response = grade_all_in_one(batch_groups, requirements, templates["batch"], llm)
+            prompt_tokens = {
+                "stage": "batch",
+                "estimated": estimate_message_tokens(build_batch_messages(batch_groups, requirements, templates["batch"])),
+                "actual": (llm.last_usage or {}).get("prompt_tokens"),
+                "cached": (llm.last_usage or {}).get("cached_tokens")
+            }
+        else:
+            # 开始评分：同一学生的各题并发调用LLM，已由其他同学提交过的分组不再调用
+            single_budget = code_token_budget("single", templates["single"], requirements=requirements, content="")
+            owned = {
+                key: fit_groups_to_budget({key: value}, single_budget)[key]
+                for key, value in contents.items() if claims.get(key, (None, None))[1] is None
+            }
+            with timer.span("grading"):
+                owned_scores = clients.run(grade_groups_async(
+                    owned, requirements, templates["single"], clients,
+                    structured=structured_output, stream=grading_mode == "stream"
+                ))
+            graded = dict(zip(owned, owned_scores))
+    finally:
+        # 无论批改是否出错都要完成本学生负责的分组，否则提交相同内容的同学会一直等待；
+        # 批改失败的结果（-99）不交给他们，由他们各自重新批改
+        for key, (future, first_owner) in claims.items():
+            if first_owner is None:
+                result = graded.get(key)
+                future.set_result(None if result is None or is_grading_failure(result) else result)
+    
+    if grading_mode != "batch":
+        regrade = {}
+        with timer.span("wait_duplicates"):
+            for key, (future, first_owner) in claims.items():
+                if first_owner is not None:
+                    result = future.result()
+                    if result is None:
+                        regrade[key] = fit_groups_to_budget({key: contents[key]}, single_budget)[key]
+                    else:
+                        graded[key] = result
+        if regrade:
+            yield json.dumps({
+                "type": "warning",
+                "message": f"{len(regrade)} 组相同提交的批改失败，重新批改: " + "，".join(regrade)
+            }, ensure_ascii=False) + "\n"
+            with timer.span("grading"):
+                regrade_scores = clients.run(grade_groups_async(
+                    regrade, requirements, templates["single"], clients,
+                    structured=structured_output, stream=grading_mode == "stream"
+                ))
+            graded.update(zip(regrade, regrade_scores))
+        scores = [graded[key] for key in contents]
+        failed = [key for key in list(owned) + list(regrade) if graded[key].get("error")]
+        if failed:
+            yield json.dumps({
+                "type": "warning",
+                "message": f"{len(failed)} 组的LLM评分调用失败: " + "；".join(
+                    f"{key}（{graded[key]['error']}）" for key in failed
+                )
+            }, ensure_ascii=False) + "\n"
+        reasked = [key for key in list(owned) + list(regrade) if graded[key].get("reasked")]
+        if reasked:
+            yield json.dumps({
+                "type": "warning",
+                "message": f"{len(reasked)} 组的回答格式有误，已追问补全: " + "，".join(
+                    f"{key}{'' if graded[key]['score'] != -1 else '（仍失败）'}" for key in reasked
+                )
+            }, ensure_ascii=False) + "\n"
+    
+    
+    if assignment_type == "实验":
+        sum_score = 0
+        if len(scores) < num_questions:
+            yield json.dumps({
+                "type": "warning",
+                "message": "作业数量与题目数量不一致"
+            }, ensure_ascii=False) + "\n"
+            score_final = -2
+        else:
+            for ans in scores:
+                score = int(ans["score"])
+                if score >= 0:
+                    sum_score += score
+            if len(scores) == 0:
+                yield json.dumps({
+                    "type": "warning",
+                    "message": "作业总数除0"
+                }, ensure_ascii=False) + "\n"
+            score_final = sum_score // len(scores) if len(scores) > 0 else 0
+    elif assignment_type == "理论":
+        if len(scores) < num_questions:
+            if len(scores) > 3:
+                score_final = "C"
+            else:
+                yield json.dumps({
+                    "type": "warning",
+                    "message": "作业数量与题目数量不一致"
+                }, ensure_ascii=False) + "\n"
+                score_final = -2
+        else:
+            score_values = [score_dict["score"] for score_dict in scores if "score" in score_dict]
+            score_final = Counter(score_values).most_common(1)[0][0] if score_values else "D"
+
+    if grading_mode == "batch":
+        yield json.dumps({
+            "type": "info",
+            "message": f"总结：{llm_response[:100]}..."  # 只显示前100个字符
+        }, ensure_ascii=False) + "\n"
+    else:
+        score_summary = ""
+        for key, result in zip(contents, scores):
+            score_summary += f"文件: {key} 得分: {result['score']}\n"
+        
+        # 超出预算时压缩代码，得分偏低、需要在总结中说明的题目尽量保留原样
+        flagged = [key for key, result in zip(contents, scores) if is_flagged_score(result["score"])]
+        summary_groups = fit_groups_to_budget(
+            contents,
+            code_token_budget("summary", templates["summary"], requirements=requirements,
+                              cpp_code="", score_summary=score_summary),
+            keep=flagged
+        )
+        contents_list = []
+        for key, value in summary_groups.items():
+            contents_list.append(f"文件名: {key}\n代码内容:\n{value}\n==================\n")
+        cpp_code = "\n".join(contents_list)
+        
+        # 生成总结
+        prompt = templates["summary"].format(
+            requirements=requirements,
+            cpp_code=cpp_code,
+            score_summary=score_summary
+        )
+
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        prompt_tokens = {"stage": "summary", "estimated": estimate_message_tokens(messages), "actual": None,
+                         "cached": None}
+    
+        try:
+            # 使用流式调用并处理思考过程
+            with timer.span("summary"):
+                response = llm.generate(messages, temperature=0.1, enable_thinking=False)
+
+            # 处理响应内容
+            if response:
+                llm_response = response
+                yield json.dumps({
+                    "type": "info",
+                    "message": f"总结：{llm_response[:100]}..."  # 只显示前100个字符
+                }, ensure_ascii=False) + "\n"
+            else:
+                llm_response = "LLM未生成任何响应内容"
+            prompt_tokens["actual"] = (llm.last_usage or {}).get("prompt_tokens")
+            prompt_tokens["cached"] = (llm.last_usage or {}).get("cached_tokens")
+
+        except Exception as e:
+            llm_response = f"LLM反馈生成失败: {str(e)}"
+            yield json.dumps({
+                "type": "error",
+                "message": llm_response
+            }, ensure_ascii=False) + "\n"
+
+    yield json.dumps({
+        "type": "info",
+        "message": f"{'合并批改' if prompt_tokens['stage'] == 'batch' else '总结'}提示词token: "
+                   f"预估 {prompt_tokens['estimated']}，实际 "
+                   f"{prompt_tokens['actual'] if prompt_tokens['actual'] is not None else '未知（未调用或命中缓存）'}"
+                   f"{'，命中上下文缓存 ' + str(prompt_tokens['cached']) if prompt_tokens['cached'] else ''}",
+        "prompt_tokens": prompt_tokens
+    }, ensure_ascii=False) + "\n"
+
+    if duplicates:
+        llm_response += "\n【重复提交】" + "；".join(
+            f"{key} 与 {first_owner} 的提交相同" for key, first_owner in duplicates.items()
+        )
+
+    timings = timer.to_dict()
+    yield json.dumps({
+        "type": "info",
+        "message": f"处理完成: {student_name} - 得分: {score_final}，耗时 {timings['total']} 秒",
+        "student_id": student_id,
+        "timings": timings
+    }, ensure_ascii=False) + "\n"
+    return {
+        "student_id": student_id,
+        "student_name": student_name,
+        "score": score_final,
+        "feedback": llm_response,
+        "grouping": grouping,
+        "duplicates": len(duplicates),
+        "questions": [
+            {"group": key, "question": result["question"], "score": result["score"]}
+            for key, result in zip(contents, scores)
+        ]
+    }
+
+
+def parse_batch_response(response, group_names):
+    """
+    解析一次性批改的LLM响应
+
+    每组一行 [<group>组名</group>,<question>题号</question>,<score>分数</score>]，
+    去掉组名后按单题评分的格式解析；最后的 <summary> 为总结评论。
+
+    Args:
+        response: LLM响应文本
+        group_names: 组名列表
+
+    Returns:
+        (评分结果列表, 总结评论)，评分结果顺序与 group_names 一致，缺失的组均为 -1
+    """
+    if not response:
+        return [{"question": -1, "score": -1} for _ in group_names], "LLM未生成任何响应内容"
+
+    group_scores = {}
+    for line in response.splitlines():
+        group_match = re.search(r'<group>\s*([^<]*?)\s*</group>\s*[,，]?\s*', line)
+        if not group_match:
+            continue
+        group_scores[group_match.group(1)] = parse_grading_response(line.replace(group_match.group(0), '', 1))
+
+    summary_match = re.search(r'<summary>(.*?)</summary>', response, re.DOTALL)
+    summary = summary_match.group(1).strip() if summary_match else response.strip()
+
+    scores = [group_scores.get(name, {"question": -1, "score": -1}) for name in group_names]
+    return scores, summary
+
+
+def build_batch_messages(groups, requirements, template):
+    """构造一次性批改的对话消息"""
+    group_text = "\n".join(f"##### {name} #####\n{content}" for name, content in groups.items())
+    prompt = template.format(requirements=requirements, groups=group_text)
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def code_token_budget(stage, template, **fields):
+    """
+    计算某阶段留给学生代码的token预算
+
+    Args:
+        stage: TOKEN_BUDGETS 中的阶段名
+        template: 该阶段的模板
+        **fields: 模板中除代码以外的字段（代码字段传空字符串）
+
+    Returns:
+        阶段预算扣除系统提示词、模板和作业要求等固定部分后的token数
+    """
+    overhead = estimate_message_tokens([
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": template.format(**fields)}
+    ])
+    return max(0, TOKEN_BUDGETS[stage] - overhead)
+
+
+def is_flagged_score(score):
+    """分数低于90或评级为C/D（含未找到题目、批改失败）的题目需要在总结中说明"""
+    try:
+        return int(score) < 90
+    except (TypeError, ValueError):
+        return str(score).upper() in ("C", "D")
+
+
+def is_grading_failure(result):
+    """LLM调用出错的评分结果（-99），不能作为成绩交给提交相同内容的同学"""
+    return str(result.get("score")) == "-99"
+
+
+def grade_all_in_one(groups, requirements, template, llm):
+    """
+    用一次LLM调用批改一个学生的所有题目分组并生成总结
+
+    Args:
+        groups: 分组后的文件内容，键为组标识，值为合并后的内容
+        requirements: 作业要求
+        template: 一次性批改模板
+        llm: Qwen3LLM 实例
+
+    Returns:
+        (评分结果列表, 总结评论)，评分结果顺序与 groups 一致
+    """
+    messages = build_batch_messages(groups, requirements, template)
+
+    try:
+        response = llm.generate(messages, temperature=0.1, enable_thinking=False)
+        return parse_batch_response(response, list(groups.keys()))
+    except Exception as e:
+        print(f"LLM调用或解析失败: {str(e)}")
+        return [{"question": -99, "score": -99} for _ in groups], f"LLM批改失败: {str(e)}"
+
+
+def collect_events(events):
+    """
+    在工作线程中运行进度事件生成器，收集全部事件及其返回值
+
+    Args:
+        events: 进度事件生成器
+
+    Returns:
+        (事件列表, 生成器返回值)
+    """
+    collected = []
+    while True:
+        try:
+            collected.append(next(events))
+        except StopIteration as stop:
+            return collected, stop.value
+
+
+def build_grading_messages(content, requirements, template, structured=False):
+    """
+    构造单题评分的对话消息，structured 为True时要求模型输出JSON
+
+    模板中学生的作业内容位于最后，系统消息、评分要求和输出格式在整个运行中保持不变，
+    构成所有学生共享的提示词前缀，可以命中服务端的上下文缓存。
+    """
+    prompt = template.format(requirements=requirements, content=content)
+    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + JSON_OUTPUT if structured else SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def grading_request_options(structured=False):
+    """单题评分请求的参数，structured 为True时使用JSON输出模式"""
+    options = {"temperature": 0.1, "enable_thinking": False}
+    if structured:
+        options["response_format"] = {"type": "json_object"}
+    return options
+
+
+def _extract_json_fields(text):
+    """从响应中第一个 {...} 里提取合法的题号和分数"""
+    fields = {}
+    json_match = re.search(r'\{.*?\}', text, re.S)
+    if not json_match:
+        return fields
+    try:
+        data = json.loads(json_match.group(0))
+    except ValueError:
+        return fields
+    if isinstance(data, dict):
+        if re.fullmatch(r'-?\d+', str(data.get("question", "")).strip()):
+            fields["question"] = str(data["question"]).strip()
+        if re.fullmatch(r'[A-Za-z0-9]+', str(data.get("score", "")).strip()):
+            fields["score"] = str(data["score"]).strip()
+    return fields
+
+
+def grading_answer_complete(text):
+    """
+    流式评分的提前停止条件：已收到完整的评分标签，或包含题号和分数的JSON对象
+
+    只认完整的格式，不使用宽松匹配，避免分数只收到一半（如 "8" 之后还有 "8"）时就停止。
+    """
+    return GRADING_TAG_PATTERN.search(text) is not None or len(_extract_json_fields(text)) == 2
+
+
+def extract_grading_fields(response):
+    """
+    从单题评分的LLM响应中提取题号和分数
+
+    依次尝试JSON、标准格式 [<question>题号</question>,<score>分数</score>] 和宽松格式，
+    只返回提取到的字段，缺少的字段不在结果中。
+    """
+    if not response:
+        return {}
+    llm_response = response.strip()
+    
+    fields = _extract_json_fields(llm_response)
+    if len(fields) == 2:
+        return fields
+    
+    # 使用正则表达式匹配标准格式
+    match = GRADING_TAG_PATTERN.search(llm_response)
+    if match:
+        return {"question": match.group(1), "score": match.group(2)}
+    
+    # 宽松匹配：分别查找题号和分数
+    if "question" not in fields:
+        question_match = re.search(r'<question>(-?\d+)</question>', llm_response) or \
+            re.search(r'题号[：:]?\s*(-?\d+)', llm_response)
+        if question_match:
+            fields["question"] = int(question_match.group(1))
+    if "score" not in fields:
+        score_match = re.search(r'<score>([A-Za-z0-9]+)</score>', llm_response) or \
+            re.search(r'分数[：:]?\s*(-?\d+)', llm_response)
+        if score_match:
+            score = score_match.group(1)
+            fields["score"] = int(score) if re.fullmatch(r'-?\d+', score) else score
+    return fields
+
+
+def parse_grading_response(response):
+    """
+    从单题评分的LLM响应中提取题号和分数
+    
+    Args:
+        response: LLM响应文本
+        
+    Returns:
+        包含 question 和 score 的字典，无法提取时均为 -1
+    """
+    if not response:
+        return {"question": -1, "score": -1}
+    print(f"LLM题目评分: {response.strip()}")
+    
+    fields = extract_grading_fields(response)
+    if "question" in fields and "score" in fields:
+        return fields
+    print("无法从响应中提取题号和分数")
+    return {"question": -1, "score": -1}
+
+
+GRADING_FIELD_NAMES = {"question": "题号", "score": "分数"}
+
+
+def build_reask_messages(messages, response, fields, structured=False):
+    """
+    回答缺少字段时的追问：在原对话后附上模型的回答，只要求补充缺少的字段，
+    不需要重新批改整份作业
+    """
+    missing = "和".join(name for key, name in GRADING_FIELD_NAMES.items() if key not in fields)
+    answer_format = '{"question": 题号, "score": 分数}' if structured \
+        else "[<question>题号</question>,<score>分数</score>]"
+    return messages + [
+        {"role": "assistant", "content": response or ""},
+        {"role": "user", "content": REASK_ONE.format(missing=missing, format=answer_format)}
+    ]
+
+
+def merge_reask_fields(fields, reask_response):
+    """合并追问得到的字段，首次回答中已有的字段优先；仍有缺失时返回 -1"""
+    merged = {**extract_grading_fields(reask_response), **fields}
+    if "question" in merged and "score" in merged:
+        return {"question": merged["question"], "score": merged["score"], "reasked": True}
+    return {"question": -1, "score": -1, "reasked": True}
+
+
+def grad_one_with_custom_llm(content, requirements, template, llm, structured=False):
+    """
+    批改一道题，回答中缺少题号或分数时追问一次缺少的字段
+
+    Returns:
+        包含 question 和 score 的字典；经过追问的带有 reasked 标记
+    """
+    messages = build_grading_messages(content, requirements, template, structured)
+    options = grading_request_options(structured)
+    
+    try:
+        response = llm.generate(messages, **options)
+        print(f"LLM题目评分: {(response or '').strip()}")
+        fields = extract_grading_fields(response)
+        if "question" in fields and "score" in fields:
+            return fields
+        print(f"回答缺少题号或分数，追问: {(response or '').strip()[:100]}")
+        reask_response = llm.generate(build_reask_messages(messages, response, fields, structured),
+                                      max_tokens=REASK_MAX_TOKENS, **options)
+        return merge_reask_fields(fields, reask_response)
+                
+    except Exception as e:
+        print(f"LLM调用或解析失败: {str(e)}")
+        return {"question": -99, "score": -99}
+
+
+async def agrad_one_with_custom_llm(content, requirements, template, llm, structured=False, stream=False):
+    """
+    grad_one_with_custom_llm 的异步版本，llm 为 AsyncQwen3LLM
+
+    stream 为True时流式接收回答，收到完整的评分标签后立即关闭连接，不等模型写完其后的解释。
+    不打印日志，调用失败的原因放在结果的 error 字段中，由 grade_student 作为进度事件输出。
+    """
+    messages = build_grading_messages(content, requirements, template, structured)
+    options = grading_request_options(structured)
+    
+    try:
+        if stream:
+            response = await llm.astream_until(messages, grading_answer_complete, **options)
+        else:
+            response = await llm.agenerate(messages, **options)
+        fields = extract_grading_fields(response)
+        if "question" in fields and "score" in fields:
+            return fields
+        reask_response = await llm.agenerate(build_reask_messages(messages, response, fields, structured),
+                                             max_tokens=REASK_MAX_TOKENS, **options)
+        return merge_reask_fields(fields, reask_response)
+                
+    except Exception as e:
+        return {"question": -99, "score": -99, "error": str(e)}
+
+
+async def grade_groups_async(groups, requirements, template, clients, structured=False, stream=False):
+    """
+    并发批改一个学生的所有题目分组
+
+    Args:
+        groups: 分组后的文件内容，键为组标识，值为合并后的内容
+        requirements: 作业要求
+        template: 单题评分模板
+        clients: 本次运行共享的 LLMClientRegistry，协程应通过其 run 方法运行
+        structured: 是否使用JSON输出模式
+        stream: 是否流式接收回答，收到评分标签后提前停止
+
+    Returns:
+        评分结果列表，顺序与 groups 一致
+    """
+    if not groups:
+        return []
+    llm = clients.async_llm()
+    return await asyncio.gather(*(
+        agrad_one_with_custom_llm(content, requirements, template, llm, structured, stream)
+        for content in groups.values()
+    ))
+
+def save_results_to_csv(results, output_file="grading_results.csv"):
+    """
+    将评分结果保存为CSV文件
+    
+    Args:
+        results: 评分结果列表
+        output_file: 输出文件名
+    """
+    import csv
+    with open(output_file, 'w', newline='', encoding='utf-8-sig') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
+        
+        writer.writeheader()
+        for result in results:
+            writer.writerow(csv_row(result))
+    
+    print(f"评分结果已保存至 {output_file}")
+
+def parse_shard(value):
+    """解析 i/n 形式的分片参数"""
+    import argparse
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/n，如 0/4: {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"分片序号应满足 0 <= i < n: {value}")
+    return index, count
+
+def parse_run_id(value):
+    """校验运行ID，避免日志和清单写到 runs/ 目录之外"""
+    import argparse
+    if not RUN_ID_PATTERN.fullmatch(value):
+        raise argparse.ArgumentTypeError(f"运行ID只能包含字母、数字、下划线和连字符: {value}")
+    return value
+
+def parse_formats(value):
+    """解析逗号分隔的输出格式列表，如 csv,jsonl"""
+    import argparse
+    formats = tuple(dict.fromkeys(part.strip().lower() for part in value.split(',') if part.strip()))
+    unknown = [fmt for fmt in formats if fmt not in OUTPUT_FORMATS]
+    if not formats or unknown:
+        raise argparse.ArgumentTypeError(f"输出格式应为 {', '.join(OUTPUT_FORMATS)} 中的一个或多个: {value}")
+    return formats
+
+def run_workflow(params):
+    """
+    在当前进程中运行批改流程，把进度逐行打印到标准输出
+
+    Returns:
+        成功时为最后的 success 事件，否则为None
+    """
+    prefix = f"[分片 {params['shard'][0]}/{params['shard'][1]}] " if params.get("shard") else ""
+    result = None
+    try:
+        for chunk in process_homework_workflow(**params):
+            event = json.loads(chunk)
+            print(f"{prefix}[{event['type']}] {event['message']}", flush=True)
+            if event["type"] == "success":
+                result = event
+    except Exception as e:
+        print(f"{prefix}[error] 批改流程失败: {str(e)}", flush=True)
+        return None
+    return result
+
+def read_results_csv(path):
+    """读取 save_results_to_csv 写出的成绩单"""
+    import csv
+    with open(path, newline='', encoding='utf-8-sig') as csvfile:
+        return [
+            {
+                'student_id': row['学号'],
+                'student_name': row['姓名'],
+                'score': row['得分'],
+                'feedback': row['作业情况']
+            }
+            for row in csv.DictReader(csvfile)
+        ]
+
+def read_results_jsonl(path):
+    """读取 JSONL 结果文件，返回 (ZIP文件相对路径, 评分结果) 列表"""
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                rows.append((record.get('path') or record['zip_file'], {
+                    'student_id': record['student_id'],
+                    'student_name': record['student_name'],
+                    'score': record['score'],
+                    'feedback': record['feedback']
+                }))
+    return rows
+
+def merge_result_files(input_files, output_file):
+    """
+    把多个分片的成绩单合并为一份
+
+    输入全部为 JSONL 结果文件时按ZIP文件的相对路径排序，与单进程运行的顺序一致；
+    输入中有CSV时CSV中没有ZIP文件名，按学号排序。
+    不做去重：同一学生的多份提交都会保留，由 transfer_grade 的重复检查发现。
+
+    Returns:
+        合并后的记录数
+    """
+    if all(path.lower().endswith('.jsonl') for path in input_files):
+        rows = [row for path in input_files for row in read_results_jsonl(path)]
+        results = [result for _, result in sorted(rows, key=lambda row: row[0])]
+    else:
+        results = []
+        for path in input_files:
+            if path.lower().endswith('.jsonl'):
+                results.extend(result for _, result in read_results_jsonl(path))
+            else:
+                results.extend(read_results_csv(path))
+        results.sort(key=lambda result: result['student_id'])
+    save_results_to_csv(results, output_file=output_file)
+    return len(results)
+
+def grade_command(args):
+    if args.requirements_file:
+        with open(args.requirements_file, encoding='utf-8') as f:
+            requirements = f.read()
+    else:
+        requirements = args.requirements
+    api_key = args.api_key or os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        print("错误: 请通过 --api-key 或 DASHSCOPE_API_KEY 环境变量提供API密钥", file=sys.stderr)
+        return 1
+
+    output_file = args.output or f"grading_results_{int(time.time())}.csv"
+    run_id = args.run_id or time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    params = dict(
+        search_dir=args.search_dir,
+        requirements=requirements,
+        num_questions=args.num_questions,
+        assignment_type=args.type,
+        base_url=args.base_url,
+        model_name=args.model,
+        api_key=api_key,
+        max_workers=args.workers,
+        use_cache=args.cache,
+        run_id=run_id,
+        grading_mode=args.mode,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        shard=args.shard,
+        output_file=output_file,
+        # 多进程时各子分片的JSONL（包含ZIP文件名）用于按单进程的顺序合并，始终输出
+        output_formats=args.format if args.processes <= 1 else tuple(dict.fromkeys(("csv", "jsonl") + args.format)),
+        structured_output=args.structured_output,
+        llm_max_connections=args.max_connections,
+        llm_timeout=args.llm_timeout
+    )
+    if args.processes <= 1:
+        return 0 if run_workflow(params) else 1
+
+    # 把当前分片再拆成 processes 个子分片：子分片 k 为 (i + k*n) / (n*processes)，
+    # 其文件恰好是分片 i/n 的一部分，各子分片互不重叠
+    index, count = args.shard or (0, 1)
+    stem, ext = os.path.splitext(output_file)
+    shard_params = [
+        dict(params, shard=(index + k * count, count * args.processes), output_file=f"{stem}.part{k}{ext or '.csv'}")
+        for k in range(args.processes)
+    ]
+    # 限速是按进程计算的，平分到各进程
+    for sub in shard_params:
+        if args.requests_per_minute:
+            sub["requests_per_minute"] = args.requests_per_minute / args.processes
+        if args.tokens_per_minute:
+            sub["tokens_per_minute"] = args.tokens_per_minute / args.processes
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        outcomes = list(pool.map(run_workflow, shard_params))
+
+    finished = [outcome["outputs"] for outcome in outcomes if outcome]
+    count = merge_result_files([outputs["jsonl"] for outputs in finished], output_file)
+    for fmt in args.format:
+        if fmt != "csv":
+            merge_record_files(fmt, [outputs[fmt] for outputs in finished], f"{stem}.{fmt}")
+    print(f"已合并 {len(finished)} 个子分片的结果，共 {count} 份作业，保存至 {output_file}")
+    if len(finished) < len(shard_params):
+        print(f"错误: {len(shard_params) - len(finished)} 个子分片未完成，使用相同的 --run-id 重跑可继续",
+              file=sys.stderr)
+        return 1
+    for outputs in finished:
+        for path in outputs.values():
+            os.remove(path)
+    return 0
+
+def merge_command(args):
+    count = merge_result_files(args.inputs, args.output)
+    print(f"已合并 {len(args.inputs)} 个成绩单，共 {count} 份作业")
+    return 0
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="命令行批量批改作业，不需要启动Web界面")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    grade = subparsers.add_parser("grade", help="批改目录中的全部作业")
+    grade.add_argument("search_dir", help="包含学生作业ZIP文件的目录")
+    requirement_source = grade.add_mutually_exclusive_group(required=True)
+    requirement_source.add_argument("--requirements", help="作业要求")
+    requirement_source.add_argument("--requirements-file", help="从文件读取作业要求（UTF-8）")
+    grade.add_argument("--num-questions", type=int, required=True, help="题目数量")
+    grade.add_argument("--type", choices=["实验", "理论"], default="实验", help="作业类型（默认：实验）")
+    grade.add_argument("--mode", choices=GRADING_MODES, default="per_question", help="批改方式（默认：per_question）")
+    grade.add_argument("--base-url", default="https://dashscope.aliyuncs.com/compatible-mode/v1", help="LLM API基础URL")
+    grade.add_argument("--model", default="qwen3-235b-a22b", help="模型名称")
+    grade.add_argument("--api-key", help="API密钥（默认读取DASHSCOPE_API_KEY环境变量）")
+    grade.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="每个进程同时批改的学生数")
+    grade.add_argument("--processes", type=int, default=1, help="把作业分给多少个进程批改（默认：1）")
+    grade.add_argument("--shard", type=parse_shard, help="只批改第 i 个分片（共 n 个），格式 i/n，用于多台机器分工")
+    grade.add_argument("--run-id", type=parse_run_id, help="运行ID，使用已有的运行ID可以从中断处继续")
+    grade.add_argument("-o", "--output", help="结果CSV文件名（默认按时间戳生成）")
+    grade.add_argument("--format", type=parse_formats, default=("csv",),
+                       help="输出格式，逗号分隔，可选 csv、jsonl、parquet（默认：csv）；"
+                            "jsonl 和 parquet 与CSV同名，包含每题得分")
+    grade.add_argument("--cache", action="store_true", help="启用持久化的LLM响应缓存")
+    grade.add_argument("--structured-output", action="store_true",
+                       help="单题评分使用JSON输出模式（需要模型支持 response_format）")
+    grade.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                       help=f"每个进程共享的LLM连接池大小（默认：{DEFAULT_MAX_CONNECTIONS}）")
+    grade.add_argument("--llm-timeout", type=float, default=DEFAULT_TIMEOUT,
+                       help=f"单次LLM请求的超时秒数（默认：{DEFAULT_TIMEOUT:g}）")
+    grade.add_argument("--requests-per-minute", type=float, help="每分钟LLM请求数上限")
+    grade.add_argument("--tokens-per-minute", type=float, help="每分钟LLM token数上限")
+    grade.set_defaults(handler=grade_command)
+
+    merge = subparsers.add_parser("merge", help="合并各分片的成绩单")
+    merge.add_argument("inputs", nargs="+", help="分片的结果文件，使用 JSONL 时按ZIP文件的相对路径排序，与单进程运行的顺序一致")
+    merge.add_argument("-o", "--output", required=True, help="合并后的CSV文件名")
+    merge.set_defaults(handler=merge_command)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+if __name__ == "__main__":
+    main()
@@ -20,153 +20,140 @@ def normalize_key(student_id, student_name):
     
     return f"{student_id}_{student_name}"
 
+def normalize_keys(student_ids, student_names):
+    """
+    normalize_key 的向量化版本，对整列学号和姓名一次生成键
+
+    规则与 normalize_key 相同：小数形式的学号取整，缺失的姓名视为空字符串，去除首尾空白。
+    """
+    student_ids = pd.Series(student_ids, dtype=object).reset_index(drop=True)
+    student_names = pd.Series(student_names, dtype=object).reset_index(drop=True)
+
+    floats = student_ids.map(lambda value: isinstance(value, float)) & student_ids.notna()
+    ids = student_ids.map(str)
+    if floats.any():
+        ids[floats] = student_ids[floats].astype('float64').astype('int64').map(str)
+
+    names = student_names.where(student_names.notna(), "").map(str)
+    return ids.str.strip() + "_" + names.str.strip()
+
+def _header_key(value):
+    """表头单元格的比较值：Excel 中的数字表头（如 5 或 5.0）与文本 '5' 视为相同"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return "" if value is None else str(value).strip()
+
+def find_header_columns(ws, header_row):
+    """读取表头行，返回表头到列号（从1开始）的映射，同名表头取第一列"""
+    columns = {}
+    header = next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True), ())
+    for col, value in enumerate(header, start=1):
+        key = _header_key(value)
+        if key and key not in columns:
+            columns[key] = col
+    return columns
+
+def merge_gradebooks(source_path, target_path, output_path, column_map, header_row=6,
+                     id_col=2, name_col=3, verbose=False):
+    """
+    按 (学号, 姓名) 把源成绩表中的若干列合并到目标成绩表
+
+    Args:
+        source_path: 源Excel文件，表头在 header_row 行
+        target_path: 目标Excel文件，表头同样在 header_row 行，数据从下一行开始
+        output_path: 输出文件路径
+        column_map: 源表头到目标列的映射；目标可以是表头名称，也可以是列号（从1开始）
+        header_row: 表头所在的Excel行号
+        id_col: 学号所在列号（两个文件相同）
+        name_col: 姓名所在列号（两个文件相同）
+        verbose: 是否逐条输出匹配成功的学生
+
+    Returns:
+        目标表中未匹配到的 (学号, 姓名) 列表
+    """
+    source = pd.read_excel(source_path, header=header_row - 1)
+    source_headers = {_header_key(column): column for column in source.columns}
+    missing = [column for column in column_map if _header_key(column) not in source_headers]
+    if missing:
+        raise ValueError(f"源文件中没有这些列: {missing}")
+
+    # 源表按键索引，重复的学生以最后一行为准
+    source_keys = normalize_keys(source.iloc[:, id_col - 1], source.iloc[:, name_col - 1])
+    values = source[[source_headers[_header_key(column)] for column in column_map]].copy()
+    values.index = source_keys.values
+    values = values[~values.index.duplicated(keep='last')]
+    values = values.astype(object).where(values.notna(), None)
+
+    wb = load_workbook(target_path)
+    ws = wb.active
+
+    target_headers = find_header_columns(ws, header_row)
+    target_columns = []
+    for source_column, target in column_map.items():
+        if isinstance(target, int):
+            target_columns.append(target)
+        elif _header_key(target) in target_headers:
+            target_columns.append(target_headers[_header_key(target)])
+        else:
+            raise ValueError(f"目标文件中没有列 '{target}'（对应源列 '{source_column}'）")
+
+    # 一次读出目标表的学号和姓名，整列生成键后与源表对齐
+    rows = list(ws.iter_rows(min_row=header_row + 1, min_col=min(id_col, name_col),
+                             max_col=max(id_col, name_col), values_only=True))
+    target_ids = [row[id_col - min(id_col, name_col)] for row in rows]
+    target_names = [row[name_col - min(id_col, name_col)] for row in rows]
+    present = pd.Series(target_ids, dtype=object).notna() & pd.Series(target_names, dtype=object).notna()
+    target_keys = normalize_keys(target_ids, target_names)
+    matched = target_keys.isin(values.index) & present
+    aligned = values.reindex(target_keys[matched]).to_numpy()
+
+    # 只写回匹配到的单元格，最后一次性保存
+    for (offset, key), row_values in zip(target_keys[matched].items(), aligned):
+        excel_row = header_row + 1 + offset
+        for target_col, value in zip(target_columns, row_values):
+            ws.cell(row=excel_row, column=target_col).value = value
+        if verbose:
+            print(f"匹配成功: {key}")
+    wb.save(output_path)
+
+    unmatched = present & ~matched
+    return [(target_ids[i], target_names[i]) for i in unmatched[unmatched].index]
+
 def match_and_copy_fixed(file1_path, file2_path, output_path="实验final_结果.xlsx"):
     """
-    根据实际文件结构修正的匹配代码
+    把文件1中第5-9次作业的成绩按学生复制到文件2
+
+    文件2的表头中有 5-9 列时按表头定位，否则写入 H,I,K,L,M 列。
     """
-    
     print("=== 开始处理 ===")
-    
-    # 读取文件1，使用header=5（第6行作为表头，第7行开始数据）
-    df1 = pd.read_excel(file1_path, header=5)
-    
-    # 读取文件2，使用header=5
-    df2 = pd.read_excel(file2_path, header=5)
-    
-    print("\n=== 文件1结构 ===")
-    print("列名:", df1.columns.tolist())
-    print("前3行数据:")
-    print(df1.head(3))
-    
-    print("\n=== 文件2结构 ===")
-    print("列名:", df2.columns.tolist())
-    print("前3行数据:")
-    print(df2.head(3))
-    
-    # 提取学号和姓名
-    # 根据调试结果，学号在'Unnamed: 1'，姓名在'Unnamed: 2'
-    df1['学号'] = df1['Unnamed: 1'].apply(lambda x: str(int(x)) if pd.notna(x) and isinstance(x, float) else str(x)).str.strip()
-    df1['姓名'] = df1['Unnamed: 2'].astype(str).str.strip()
-    
-    df2['学号'] = df2['Unnamed: 1'].apply(lambda x: str(int(x)) if pd.notna(x) and isinstance(x, float) else str(x)).str.strip()
-    df2['姓名'] = df2['Unnamed: 2'].astype(str).str.strip()
-    
-    # 创建唯一键
-    df1['key'] = df1.apply(lambda row: f"{row['学号']}_{row['姓名']}", axis=1)
-    df2['key'] = df2.apply(lambda row: f"{row['学号']}_{row['姓名']}", axis=1)
-    
-    print(f"\n=== 数据统计 ===")
-    print(f"文件1记录数: {len(df1)}")
-    print(f"文件2记录数: {len(df2)}")
-    print(f"文件1前5个学生: {df1['key'].head().tolist()}")
-    print(f"文件2前5个学生: {df2['key'].head().tolist()}")
-    
-    # 创建数据映射字典
-    data_map = {}
-    for idx, row in df1.iterrows():
-        key = row['key']
-        # 获取文件1的5-9次作业（对应列'5','6','7','8','9'）
-        # 这些列名来自调试输出
-        assignments = [
-            row.get('5', None),
-            row.get('6', None),
-            row.get('7', None),
-            row.get('8', None),
-            row.get('9', None)
-        ]
-        data_map[key] = assignments
-    
-    print(f"\n数据映射创建完成，共 {len(data_map)} 条记录")
-    
-    # 查看部分映射数据
-    print("\n文件1部分数据示例：")
-    sample_keys = list(data_map.keys())[:3]
-    for key in sample_keys:
-        print(f"{key}: {data_map[key]}")
-    
-    # 使用openpyxl直接操作Excel文件2
-    wb2 = load_workbook(file2_path)
-    ws2 = wb2.active
-    
-    # 找到文件2中需要填充的列位置
-    # 根据你的描述和调试结果，文件2的列结构不同
-    # 我们需要找到列名为'5','6','7','8','9'的列索引
-    print("\n=== 查找文件2的列位置 ===")
-    
-    # 先读取表头行（第6行，Excel行号6）
-    header_row = 6  # Excel中第6行是表头（因为header=5）
-    column_mapping = {}
-    
-    # 遍历所有列，找到目标列的位置
-    for col in range(1, ws2.max_column + 1):
-        cell_value = ws2.cell(row=header_row, column=col).value
-        if cell_value in ['5', '6', '7', '8', '9']:
-            column_mapping[cell_value] = col
-            print(f"找到列 '{cell_value}' 在位置 {col} (Excel列 {chr(64+col)})")
-    
-    # 如果没找到，尝试其他方法
-    if not column_mapping:
-        print("未找到标准列名，尝试根据描述查找...")
-        # 根据你的描述：文件2的D到I是1-6列，K-M是7,8,9列
-        # 但实际结构可能不同，需要调整
-        
-        # 假设：第4列开始是作业成绩
-        # 让我们打印列结构
-        print("\n文件2列结构:")
-        for col in range(1, min(20, ws2.max_column + 1)):
-            cell_value = ws2.cell(row=header_row, column=col).value
-            print(f"列 {col} ({chr(64+col)}): {cell_value}")
-    
-    # 简化：假设我们需要填充的列是H,I,K,L,M (8,9,11,12,13)
-    # 对应作业5-9
-    target_columns = [8, 9, 11, 12, 13]  # H,I,K,L,M
-    print(f"\n目标列位置: {target_columns} (H,I,K,L,M)")
-    
-    # 开始匹配和复制
-    not_found = []
-    found_count = 0
-    
-    # 从第7行开始（数据行，Excel行号7）
-    start_data_row = 7
-    
-    for excel_row in range(start_data_row, ws2.max_row + 1):
-        # 获取学号和姓名
-        student_id = ws2.cell(row=excel_row, column=2).value  # B列
-        student_name = ws2.cell(row=excel_row, column=3).value  # C列
-        
-        if pd.isna(student_id) or pd.isna(student_name):
-            continue
-
-        # 使用专门的函数标准化键值，确保与data_map中的键一致
-        key = normalize_key(student_id, student_name)
-        
-        if key in data_map:
-            assignments = data_map[key]
-            # 复制5-9次作业到目标列
-            for i in range(5):
-                target_col = target_columns[i]
-                ws2.cell(row=excel_row, column=target_col).value = assignments[i]
-            found_count += 1
-            print(f"匹配成功: {key}")  # 添加调试信息
-        else:
-            not_found.append((student_id, student_name))
-    
-    # 保存结果
-    wb2.save(output_path)
-    
+
+    assignments = ['5', '6', '7', '8', '9']
+    wb2 = load_workbook(file2_path, read_only=True)
+    try:
+        headers = find_header_columns(wb2.active, 6)
+    finally:
+        wb2.close()
+    if all(column in headers for column in assignments):
+        column_map = {column: column for column in assignments}
+    else:
+        print("文件2中未找到 5-9 列的表头，使用默认目标列 H,I,K,L,M")
+        column_map = dict(zip(assignments, [8, 9, 11, 12, 13]))
+    print(f"列映射: {column_map}")
+
+    not_found = merge_gradebooks(file1_path, file2_path, output_path, column_map)
+
     print(f"\n=== 处理结果 ===")
-    print(f"成功匹配: {found_count} 条记录")
     print(f"未匹配到: {len(not_found)} 条记录")
-    
+
     if not_found:
         print("\n未找到的学号和姓名（前20个）:")
         for i, (student_id, student_name) in enumerate(not_found[:20]):
             print(f"{i+1}. 学号: {student_id}, 姓名: {student_name}")
         if len(not_found) > 20:
             print(f"... 还有 {len(not_found)-20} 条未显示")
-    
+
     print(f"\n结果已保存到: {output_path}")
-    
+
     return not_found
 
 # 运行代码
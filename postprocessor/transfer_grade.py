@@ -3,7 +3,37 @@ import openpyxl
 from openpyxl import load_workbook
 import os
 
-def transfer_grades(excel_file, csv_file, output_file=None, unmatched_file=None):
+# 平时成绩所在列（X列，第24列）
+USUAL_GRADE_COL = 24
+# 数据起始行
+START_ROW = 6
+# 学号（B列）和姓名（C列）所在列
+ID_COL = 2
+NAME_COL = 3
+
+def normalize_cell(value):
+    """统一单元格与CSV中的值：去除首尾空白，Excel把学号存成小数时去掉 .0"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def build_grade_index(csv_df):
+    """
+    以规范化后的 (学号, 姓名) 为键建立索引，只遍历一次CSV
+
+    Returns:
+        键到该键所有CSV行号的映射，同一学生有多条记录时按出现顺序排列
+    """
+    index = {}
+    keys = zip(csv_df['学号'].map(normalize_cell), csv_df['姓名'].map(normalize_cell))
+    for position, key in enumerate(keys):
+        index.setdefault(key, []).append(position)
+    return index
+
+def transfer_grades(excel_file, csv_file, output_file=None, unmatched_file=None,
+                    grade_columns=None, lean=False, verbose=True):
     """
     将CSV文件中的成绩誊写到Excel文件中，并记录未匹配的记录
     
@@ -12,6 +42,10 @@ def transfer_grades(excel_file, csv_file, output_file=None, unmatched_file=None)
     csv_file: CSV文件路径  
     output_file: 输出Excel文件路径（可选）
     unmatched_file: 未匹配记录输出文件路径（可选）
+    grade_columns: CSV列名到Excel列号的映射，一次写入多列成绩（可选，默认把“得分”写入第24列）
+    lean: 省内存模式，流式读取Excel并逐行写出新文件，适合很大的工作簿；
+          只保留单元格的值（公式取缓存的计算结果），不保留格式和合并单元格
+    verbose: 是否逐行输出匹配结果
     """
     
     # 设置默认输出文件名
@@ -23,63 +57,76 @@ def transfer_grades(excel_file, csv_file, output_file=None, unmatched_file=None)
         name, ext = os.path.splitext(csv_file)
         unmatched_file = f"{name}_unmatched{ext}"
     
+    if grade_columns is None:
+        grade_columns = {'得分': USUAL_GRADE_COL}
+    
     try:
-        # 读取CSV文件（指定UTF-8编码）
+        # 读取CSV文件（指定UTF-8编码），学号按文本读取以保留前导零
         print("正在读取CSV文件...")
-        csv_df = pd.read_csv(csv_file, encoding='utf-8')
+        csv_df = pd.read_csv(csv_file, encoding='utf-8', dtype={'学号': str, '姓名': str})
         print(f"成功读取CSV文件，共{len(csv_df)}条记录")
         
+        missing = [column for column in grade_columns if column not in csv_df.columns]
+        if missing:
+            raise ValueError(f"CSV中没有成绩列: {', '.join(missing)}")
+        
         # 创建一个副本来追踪每条CSV记录的匹配状态
         tracking_df = csv_df.copy()
         tracking_df['匹配状态'] = "未处理"  # 初始状态
         print(f"当前未匹配的记录数: {len(tracking_df)}")
         
-        # 读取Excel文件
-        print("正在读取Excel文件...")
-        wb = load_workbook(excel_file)
-        ws = wb.active
-        
-        # 平时成绩所在列（M列，第13列）
-        usual_grade_col = 24
-        
-        # 数据起始行
-        start_row = 6
+        # 一次建立 (学号, 姓名) 索引，每行Excel只做一次字典查找
+        index = build_grade_index(csv_df)
+        grade_values = {column: csv_df[column].tolist() for column in grade_columns}
+        matched_positions = []
         
         # 更新计数器
         updated_count = 0
         
+        def lookup(student_id, student_name):
+            """返回该学生各成绩列的值，未找到时返回None"""
+            positions = index.get((normalize_cell(student_id), normalize_cell(student_name)))
+            if not positions:
+                if verbose:
+                    print(f"未找到匹配记录：{student_name} ({student_id})")
+                return None
+            # 同一学生有多条记录时取第一条，全部标记为已匹配
+            matched_positions.extend(positions)
+            grades = {column: grade_values[column][positions[0]] for column in grade_columns}
+            if verbose:
+                print(f"已更新：{student_name} ({student_id}) - 成绩：" +
+                      "，".join(str(grade) for grade in grades.values()))
+            return grades
+        
+        # 读取Excel文件
+        print("正在读取Excel文件...")
         print("开始匹配并更新成绩...")
+        if lean:
+            updated_count = _transfer_streaming(excel_file, output_file, grade_columns, lookup)
+        else:
+            wb = load_workbook(excel_file)
+            ws = wb.active
+            
+            # 遍历Excel中的每一行学生数据
+            for row in ws.iter_rows(min_row=START_ROW, max_col=max(NAME_COL, *grade_columns.values())):
+                student_id = row[ID_COL - 1].value
+                student_name = row[NAME_COL - 1].value
+                
+                # 跳过空行
+                if student_id is None or student_name is None:
+                    continue
+                
+                grades = lookup(student_id, student_name)
+                if grades is not None:
+                    for column, grade in grades.items():
+                        row[grade_columns[column] - 1].value = grade
+                    updated_count += 1
+            
+            # 保存更新后的Excel文件
+            wb.save(output_file)
         
-        # 遍历Excel中的每一行学生数据
-        for row in range(start_row, ws.max_row + 1):
-            student_id = ws.cell(row=row, column=2).value  # 学号（B列）
-            student_name = ws.cell(row=row, column=3).value  # 姓名（C列）
-
-            # 跳过空行
-            if student_id is None or student_name is None:
-                continue
-
-            # 查找CSV中匹配的记录
-            match_mask = (
-                (tracking_df['学号'].astype(str) == str(student_id)) &
-                (tracking_df['姓名'].astype(str) == str(student_name))
-            )
-
-            if match_mask.any():
-                # 获取成绩并更新Excel
-                grade = tracking_df.loc[match_mask, '得分'].values[0]
-                ws.cell(row=row, column=usual_grade_col).value = grade
-                updated_count += 1
-
-                # 标记该CSV记录为已匹配
-                tracking_df.loc[match_mask, '匹配状态'] = "已匹配"
-
-                print(f"已更新：{student_name} ({student_id}) - 成绩：{grade}")
-            else:
-                print(f"未找到匹配记录：{student_name} ({student_id})")
-
-        # 保存更新后的Excel文件
-        wb.save(output_file)
+        # 标记已匹配的CSV记录
+        tracking_df.iloc[sorted(set(matched_positions)), tracking_df.columns.get_loc('匹配状态')] = "已匹配"
 
         # 处理CSV中有但Excel中没有的记录（即未被标记为“已匹配”的）
         unmatched_records = tracking_df[tracking_df['匹配状态'] == "未处理"]
@@ -118,6 +165,37 @@ def transfer_grades(excel_file, csv_file, output_file=None, unmatched_file=None)
         print(f"处理过程中出现错误：{str(e)}")
         return False
 
+def _transfer_streaming(excel_file, output_file, grade_columns, lookup):
+    """
+    省内存模式：只读方式逐行读取活动工作表，以只写方式逐行写出，内存占用与行数无关
+
+    Returns:
+        更新的行数
+    """
+    source = load_workbook(excel_file, read_only=True, data_only=True)
+    target = openpyxl.Workbook(write_only=True)
+    try:
+        ws = source.active
+        out = target.create_sheet(ws.title)
+        width = max(ws.max_column or 0, *grade_columns.values())
+        updated_count = 0
+        for row_number, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            values = list(values) + [None] * (width - len(values))
+            if row_number >= START_ROW:
+                student_id = values[ID_COL - 1]
+                student_name = values[NAME_COL - 1]
+                if student_id is not None and student_name is not None:
+                    grades = lookup(student_id, student_name)
+                    if grades is not None:
+                        for column, grade in grades.items():
+                            values[grade_columns[column] - 1] = grade
+                        updated_count += 1
+            out.append(values)
+        target.save(output_file)
+        return updated_count
+    finally:
+        source.close()
+
 def check_duplicates(csv_file):
     """
     检查CSV文件中是否有重复的学号姓名组合
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append('.')
+
+from preprocessor.merge_zip import find_zip_header, copy_from_offset, COPY_WORKERS
+from tools.file_processor import extract_student_info
+
+
+def _stat_entry(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def build_manifest(zip_files, previous=None, max_workers=COPY_WORKERS):
+    """
+    为每份提交生成一条清单记录，不复制任何文件
+
+    每条记录包含：
+        name: 在本次运行中唯一的文件名（重名的依次加 _1、_2 后缀，与收集到目录时的命名一致）
+        path / size / mtime: 原文件的绝对路径、大小和修改时间，断点日志按相对路径记录并用大小和修改时间判断文件是否变化
+        zip_offset: ZIP 文件头的偏移，0 为正常 ZIP，大于0需要修复，-1 为找不到文件头
+        student_id / student_name: 从文件名中提取的学生信息
+
+    Args:
+        zip_files: ZIP 文件路径列表（应已排序，决定重名时的后缀）
+        previous: 上次运行的清单，路径、大小和修改时间都未变的文件直接复用其扫描结果
+        max_workers: 并行扫描文件头的线程数
+
+    Returns:
+        清单记录列表，顺序与 zip_files 一致
+    """
+    known = {
+        (entry["path"], entry["size"], entry["mtime"]): entry["zip_offset"]
+        for entry in previous or []
+    }
+
+    def scan(path):
+        entry = _stat_entry(path)
+        offset = known.get((entry["path"], entry["size"], entry["mtime"]))
+        entry["zip_offset"] = offset if offset is not None else find_zip_header(path)
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        entries = list(executor.map(scan, zip_files))
+
+    taken = set()
+    for entry in entries:
+        name = os.path.basename(entry["path"])
+        base, ext = os.path.splitext(name)
+        counter = 1
+        while name in taken:
+            name = f"{base}_{counter}{ext}"
+            counter += 1
+        taken.add(name)
+        entry["name"] = name
+        entry["student_id"], entry["student_name"] = extract_student_info(name)
+    return entries
+
+
+def save_manifest(entries, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    """读取清单，不存在或已损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def materialize(entry, repair_dir):
+    """
+    返回批改时应读取的 ZIP 路径
+
+    正常的 ZIP 直接读取原文件；文件头有偏移的才把从文件头开始的部分写入 repair_dir，
+    修复后仍无效时回退到原文件。
+    """
+    if entry["zip_offset"] <= 0:
+        return entry["path"]
+    os.makedirs(repair_dir, exist_ok=True)
+    repaired_path = os.path.join(repair_dir, entry["name"])
+    copy_from_offset(entry["path"], repaired_path, entry["zip_offset"])
+    if zipfile.is_zipfile(repaired_path):
+        return repaired_path
+    os.remove(repaired_path)
+    return entry["path"]
@@ -12,72 +12,144 @@ def find_all_zip_files(root_dir):
                 zip_files.append(os.path.join(root, file))
     return zip_files
 
+ZIP_HEADER = b'PK\x03\x04'
+SCAN_CHUNK_SIZE = 1024 * 1024
+COPY_WORKERS = 8
+# Linux 上的 FICLONE ioctl，支持的文件系统（btrfs、xfs 等）上可以零拷贝地克隆文件
+_FICLONE = 0x40049409
+
+def find_zip_header(path, chunk_size=SCAN_CHUNK_SIZE):
+    """
+    分块查找第一个 ZIP 本地文件头 PK\x03\x04 的偏移，找不到返回 -1
+
+    找到即停止读取；正常的 ZIP 在读取第一块时就能确定，不需要把整个文件读入内存。
+    """
+    overlap = len(ZIP_HEADER) - 1
+    offset = 0
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return -1
+            data = tail + chunk
+            position = data.find(ZIP_HEADER)
+            if position >= 0:
+                return offset - len(tail) + position
+            # 保留末尾几个字节，避免文件头跨越两块时漏掉
+            tail = data[-overlap:]
+            offset += len(chunk)
+
+def link_or_copy(src_path, dest_path):
+    """
+    尽量不复制数据地把文件放到 dest_path：依次尝试硬链接、reflink 克隆，最后才完整复制
+
+    收集到的 ZIP 只会被读取，与原文件共享数据是安全的。
+    """
+    try:
+        os.link(src_path, dest_path)
+        return
+    except OSError:
+        pass
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+                fcntl.ioctl(dest.fileno(), _FICLONE, src.fileno())
+            shutil.copystat(src_path, dest_path)
+            return
+        except OSError:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+    shutil.copy2(src_path, dest_path)
+
+def copy_from_offset(src_path, dest_path, offset):
+    """把 src_path 从 offset 开始的内容流式写入 dest_path"""
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+        src.seek(offset)
+        shutil.copyfileobj(src, dest, SCAN_CHUNK_SIZE)
+
 def repair_if_needed(src_path, dest_path):
     """
     尝试修复 ZIP：如果文件头不在开头，就截取从 PK\x03\x04 开始的部分
     修复后验证是否为有效 ZIP，否则回退到原样复制
     """
     try:
-        with open(src_path, 'rb') as f:
-            data = f.read()
-
         # 查找 ZIP 文件头
-        pk_offset = data.find(b'PK\x03\x04')
+        pk_offset = find_zip_header(src_path)
         if pk_offset == 0:
-            # 已经是标准 ZIP，直接复制
-            shutil.copy2(src_path, dest_path)
+            # 已经是标准 ZIP，直接链接
+            link_or_copy(src_path, dest_path)
             return True
         elif pk_offset > 0:
             # 有偏移，尝试修复
-            repaired_data = data[pk_offset:]
-            with open(dest_path, 'wb') as f:
-                f.write(repaired_data)
+            copy_from_offset(src_path, dest_path, pk_offset)
             # 验证修复后是否有效
             if zipfile.is_zipfile(dest_path):
                 return True
             else:
                 # 修复失败，回退：用原始文件
-                shutil.copy2(src_path, dest_path)
+                os.remove(dest_path)
+                link_or_copy(src_path, dest_path)
                 return zipfile.is_zipfile(dest_path)
         else:
             # 找不到 ZIP 头，直接复制（可能是损坏文件，但按要求不跳过）
-            shutil.copy2(src_path, dest_path)
+            link_or_copy(src_path, dest_path)
             return zipfile.is_zipfile(dest_path)
     except Exception:
         # 出错时仍尝试原样复制
         try:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
             shutil.copy2(src_path, dest_path)
             return zipfile.is_zipfile(dest_path)
         except Exception:
             return False
 
-def copy_and_ensure_valid(zip_files, output_dir):
-    success = 0
-    failed = []
-
-    os.makedirs(output_dir, exist_ok=True)
+def assign_destinations(zip_files, output_dir):
+    """
+    按输入顺序为每个文件确定输出路径，重名的依次加 _1、_2 后缀
 
+    在并行处理之前统一分配，结果与处理顺序无关。
+    """
+    taken = set(os.listdir(output_dir)) if os.path.isdir(output_dir) else set()
+    destinations = []
     for src in zip_files:
-        try:
-            filename = os.path.basename(src)
-            dest = os.path.join(output_dir, filename)
+        filename = os.path.basename(src)
+        base, ext = os.path.splitext(filename)
+        counter = 1
+        while filename in taken:
+            filename = f"{base}_{counter}{ext}"
+            counter += 1
+        taken.add(filename)
+        destinations.append(os.path.join(output_dir, filename))
+    return destinations
+
+def copy_and_ensure_valid(zip_files, output_dir, max_workers=COPY_WORKERS):
+    """
+    把 ZIP 文件收集到 output_dir，必要时修复文件头
 
-            # 处理重名
-            counter = 1
-            base, ext = os.path.splitext(filename)
-            while os.path.exists(dest):
-                dest = os.path.join(output_dir, f"{base}_{counter}{ext}")
-                counter += 1
+    各文件在线程池中并行处理（主要是磁盘 I/O 和文件头扫描）。
 
-            # 尝试修复或原样复制，并确保结果是有效 ZIP（或至少复制了）
-            is_valid = repair_if_needed(src, dest)
+    Returns:
+        (处理成功的文件数, 失败的源文件列表)
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
-            if is_valid:
-                success += 1
-            else:
-                # 即使无效也复制了（满足“不跳过”），但标记为“可能无法打开”
-                success += 1  # 因为文件已复制，只是内容可能损坏
-        except Exception as e:
+    os.makedirs(output_dir, exist_ok=True)
+    destinations = assign_destinations(zip_files, output_dir)
+
+    # 尝试修复或原样复制，并确保结果是有效 ZIP（或至少复制了）；
+    # 即使无效也复制了（满足“不跳过”），同样计为成功，只是内容可能损坏
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = list(executor.map(repair_if_needed, zip_files, destinations))
+
+    success = 0
+    failed = []
+    for src, dest, is_valid in zip(zip_files, destinations, outcomes):
+        if is_valid or os.path.exists(dest):
+            success += 1
+        else:
             failed.append(src)
 
     return success, failed
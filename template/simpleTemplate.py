@@ -1,12 +1,9 @@
 SCORE_ONE = """
-作为一名专业的C++编程老师，请根据作业要求批改作业：
+作为一名专业的C++编程老师，请根据作业要求批改最后给出的作业内容：
 
 作业要求:
 {requirements}
 
-作业内容:
-{content}
-
 =========================================
 这个作业内容只有所有要求中的一个，你要根据作业内容自行判断这份作业做的是作业要求中的哪一道题！
 可以提示大概率作业题号和作业要求是对齐的，但也可能不对齐，你要分辨一下。
@@ -31,40 +28,41 @@ SCORE_ONE = """
 
 [<question>-1</question>,<score>0</score>]
 
+=========================================
+作业内容:
+{content}
 """
 
 SUMMARY_SCORE = """
-作为一名专业的C++编程老师，请根据作业要求批改以下作业：
+作为一名专业的C++编程老师，请根据作业要求检查最后给出的作业及其批改结果：
 
 作业要求:
 ```{requirements}```
 
-作业内容:
-```{cpp_code}```
-
-已经有另一位老师批改了作业，结果如下
-```{score_summary}```
-
 ### 另一个老师打分要求如下：
 1. 如果代码有错误，请根据错误的严重程度给85~88分。
 2. 如果代码基本正确，可以在90~95分之间酌情给分。
 3. 如果没有找到该题对应的题目，给出0
 
+另一位老师已经批改了这份作业，批改结果附在作业内容之后。
 你检查一下是否合理，如果合理的话，给出对这份作业的总结评论，对于分数低于90分的，一定要告诉我是哪道题，错误原因是什么，100字以内
 如果不合理，请给出理由，30字以内
 
+=========================================
+作业内容:
+```{cpp_code}```
+
+另一位老师的批改结果:
+```{score_summary}```
 """
 
 
 ABC_ONE = """
-作为一名专业的C++编程老师，请根据作业要求批改作业：
+作为一名专业的C++编程老师，请根据作业要求批改最后给出的作业内容：
 
 作业要求:
 {requirements}
 
-作业内容:
-{content}
-
 =========================================
 这个作业内容只有所有要求中的一个，你要根据作业内容自行判断这份作业做的是作业要求中的哪一道题！
 可以提示大概率作业题号和作业要求是对齐的，但也可能不对齐，你要分辨一下。
@@ -89,26 +87,125 @@ ABC_ONE = """
 
 [<question>-1</question>,<score>D</score>]
 
+=========================================
+作业内容:
+{content}
 """
 
 SUMMARY_ABC = """
-作为一名专业的C++编程老师，请根据作业要求批改以下作业：
+作为一名专业的C++编程老师，请根据作业要求检查最后给出的作业及其批改结果：
 
 作业要求:
 ```{requirements}```
 
+### 评级要求如下：
+1. 如果代码有”非常严重“的错误，或者没有写完，请给出评级C。
+2. 如果代码大致正确，或者有一些小的问题但仍然能运行，请给出评级B。
+3. 如果代码基本正确，没有明显问题，请给出评级A。
+
+另一位老师已经批改了这份作业，批改结果附在作业内容之后。
+你检查一下是否合理，如果合理的话，给出对这份作业的总结评论，对于评级低于C的，一定要告诉我是哪道题，错误原因是什么，100字以内
+如果不合理，请给出理由，30字以内
+
+=========================================
 作业内容:
 ```{cpp_code}```
 
-已经有另一位老师批改了作业，结果如下
+另一位老师的批改结果:
 ```{score_summary}```
+"""
+
+BATCH_SCORE = """
+作为一名专业的C++编程老师，请根据作业要求一次性批改一名学生的全部作业：
+
+作业要求:
+```{requirements}```
+
+=========================================
+学生的作业内容在最后给出，已按题目分组，每组以 ##### 组名 ##### 开头。
+每一组作业内容只对应作业要求中的一道题，你要根据作业内容自行判断每一组做的是作业要求中的哪一道题！
+可以提示大概率组的顺序和作业要求是对齐的，但也可能不对齐，你要分辨一下。
+所以你改作业的思路是：
+1.先判断每一组作业内容对应的是哪一道题
+2.然后根据对应题目的要求分别批改每一组，给出合理的分数
+3.最后对整份作业给出总结评论
+
+### 打分要求如下：
+1. 如果代码有错误，请根据错误的严重程度给85~88分。
+2. 如果代码基本正确，可以在90~95分之间酌情给分。
+3. 如果没有找到该组对应的题目，题号返回-1，分数为0
+
+### 总结要求：
+对于分数低于90分的，一定要说明是哪道题，错误原因是什么，100字以内
+
+### 除此之外：
+！！你输出的格式必须是每组一行，然后是总结：
+[<group>组名</group>,<question>题号</question>,<score>分数</score>]
+<summary>总结评论</summary>
+
+回答格式举例：
+
+[<group>q1</group>,<question>1</question>,<score>90</score>]
+[<group>q2</group>,<question>-1</question>,<score>0</score>]
+<summary>第1题完成较好；第2组未找到对应题目。</summary>
+
+=========================================
+作业内容:
+{groups}
+"""
+
+
+BATCH_ABC = """
+作为一名专业的C++编程老师，请根据作业要求一次性批改一名学生的全部作业：
+
+作业要求:
+```{requirements}```
+
+=========================================
+学生的作业内容在最后给出，已按题目分组，每组以 ##### 组名 ##### 开头。
+每一组作业内容只对应作业要求中的一道题，你要根据作业内容自行判断每一组做的是作业要求中的哪一道题！
+可以提示大概率组的顺序和作业要求是对齐的，但也可能不对齐，你要分辨一下。
+所以你改作业的思路是：
+1.先判断每一组作业内容对应的是哪一道题
+2.然后根据对应题目的要求分别批改每一组，给出合理的评级
+3.最后对整份作业给出总结评论
 
 ### 评级要求如下：
 1. 如果代码有”非常严重“的错误，或者没有写完，请给出评级C。
 2. 如果代码大致正确，或者有一些小的问题但仍然能运行，请给出评级B。
 3. 如果代码基本正确，没有明显问题，请给出评级A。
+4. 如果没有找到该组对应的题目，题号返回-1，评级为D
 
-你检查一下是否合理，如果合理的话，给出对这份作业的总结评论，对于评级低于C的，一定要告诉我是哪道题，错误原因是什么，100字以内
-如果不合理，请给出理由，30字以内
+### 总结要求：
+对于评级为C或D的，一定要说明是哪道题，错误原因是什么，100字以内
+
+### 除此之外：
+！！你输出的格式必须是每组一行，然后是总结：
+[<group>组名</group>,<question>题号</question>,<score>评级</score>]
+<summary>总结评论</summary>
+
+回答格式举例：
 
-"""
\ No newline at end of file
+[<group>q1</group>,<question>1</question>,<score>A</score>]
+[<group>q2</group>,<question>-1</question>,<score>D</score>]
+<summary>第1题完成较好；第2组未找到对应题目。</summary>
+
+=========================================
+作业内容:
+{groups}
+"""
+
+
+# 结构化输出：追加在系统消息之后，要求模型只输出JSON（配合 response_format 使用）
+JSON_OUTPUT = """
+### 输出格式（优先于批改要求中的格式要求）：
+只输出一个JSON对象，不要输出其他任何内容：
+{"question": 题号, "score": 分数}
+score 的取值与批改要求中的格式相同；若未找到这份作业对应的题目，question 为 -1
+"""
+
+# 回答缺少字段时的追问，只要求补充缺少的字段
+REASK_ONE = """
+你上面的回答中没有按格式给出{missing}。请不要重新批改，也不要解释，只按下面的格式输出结论：
+{format}
+"""
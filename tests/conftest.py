@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与仓库中的脚本一样从项目根目录导入 main、tools 等模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
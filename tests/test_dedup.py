@@ -0,0 +1,20 @@
+from tools.dedup import SubmissionDeduplicator, normalize_code
+
+
+def test_normalize_ignores_comments_and_whitespace():
+    assert normalize_code("int a = 1; // 注释\n/* 块注释 */\nint b;") == normalize_code("int a=1;\n\nint b;")
+
+
+def test_first_owner_claims_and_others_share_the_future():
+    dedup = SubmissionDeduplicator()
+    future, first_owner = dedup.claim("int main() { return 0; }", "张三(1)")
+    assert first_owner is None
+
+    same, owner = dedup.claim("int main(){return 0;} // 抄的", "李四(2)")
+    assert owner == "张三(1)" and same is future
+
+    different, owner = dedup.claim("int main() { return 1; }", "李四(2)")
+    assert owner is None and different is not future
+
+    future.set_result({"question": 1, "score": 90})
+    assert same.result(timeout=1) == {"question": 1, "score": 90}
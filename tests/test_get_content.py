@@ -0,0 +1,29 @@
+import codecs
+
+from tools.get_content import decode_source, decode_submission
+
+
+def test_ascii_is_reported_as_utf8():
+    assert decode_source(b"int main() { return 0; }") == ("int main() { return 0; }", "utf-8")
+
+
+def test_utf8_and_gbk_sources():
+    assert decode_source("// 注释".encode("utf-8")) == ("// 注释", "utf-8")
+    assert decode_source("// 注释".encode("gbk")) == ("// 注释", "gb18030")
+
+
+def test_bom_decides_encoding():
+    assert decode_source(codecs.BOM_UTF8 + b"int a;") == ("int a;", "utf-8-sig")
+    assert decode_source("int a;".encode("utf-16")) == ("int a;", "utf-16")
+    # UTF-32 LE 的BOM以 UTF-16 LE 的BOM开头，必须识别为 UTF-32
+    assert decode_source("int a;".encode("utf-32")) == ("int a;", "utf-32")
+
+
+def test_undecodable_bytes_fall_back_to_latin1():
+    assert decode_source(b"\x81\x30") == ("\x810", "latin-1")
+
+
+def test_decode_submission_reports_each_file():
+    contents, encodings = decode_submission({"a.cpp": "// 甲".encode("gbk"), "b.cpp": b"int b;"})
+    assert contents == {"a.cpp": "// 甲", "b.cpp": "int b;"}
+    assert encodings == {"a.cpp": "gb18030", "b.cpp": "utf-8"}
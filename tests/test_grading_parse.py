@@ -0,0 +1,21 @@
+from main import extract_grading_fields, merge_reask_fields
+
+
+def test_tagged_answer():
+    assert extract_grading_fields('[<question>2</question>,<score>85</score>] 解释') == {"question": "2", "score": "85"}
+
+
+def test_json_answer():
+    assert extract_grading_fields('{"question": 3, "score": 70}') == {"question": "3", "score": "70"}
+
+
+def test_partial_and_empty_answers():
+    assert extract_grading_fields('题号: 1 没有分数') == {"question": 1}
+    assert extract_grading_fields('<score>B</score>') == {"score": "B"}
+    assert extract_grading_fields('') == {}
+
+
+def test_reask_fills_missing_fields_only():
+    merged = merge_reask_fields({"question": 1}, '<question>9</question><score>60</score>')
+    assert merged == {"question": 1, "score": 60, "reasked": True}
+    assert merge_reask_fields({}, '还是没有分数') == {"question": -1, "score": -1, "reasked": True}
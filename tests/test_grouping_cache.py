@@ -0,0 +1,74 @@
+import threading
+import time
+
+from tools.grouping_cache import GroupingCache, layout_fingerprint, layout_keys
+
+
+def submission(folder):
+    return [f"{folder}/Q1/main.cpp", f"{folder}\\q2\\main.cpp", f"{folder}/notes.cpp"]
+
+
+def assignment_for(paths):
+    # 第三个文件是零散文件，LLM分组时丢弃
+    return {"q1": [paths[0]], "q2": [paths[1]]}
+
+
+def test_layout_ignores_outer_folder_case_and_separators():
+    assert layout_keys(submission("20230001张三")) == {
+        "20230001张三/Q1/main.cpp": "q1/main.cpp",
+        "20230001张三\\q2\\main.cpp": "q2/main.cpp",
+        "20230001张三/notes.cpp": "notes.cpp",
+    }
+    assert layout_fingerprint(submission("a")) == layout_fingerprint(submission("B"))
+    assert layout_fingerprint(submission("a")) != layout_fingerprint(submission("a")[:2])
+
+
+def test_same_layout_reuses_grouping_on_own_paths():
+    cache = GroupingCache()
+    first = submission("s1")
+    assert cache.get_or_compute(first, lambda: assignment_for(first)) == (assignment_for(first), False)
+
+    second = submission("s2")
+    assignment, hit = cache.get_or_compute(second, lambda: None)
+    assert hit and assignment == assignment_for(second)
+    assert cache.stats() == {"hits": 1, "waited": 0, "misses": 1, "layouts": 1}
+
+
+def test_failed_or_empty_groupings_are_not_cached():
+    cache = GroupingCache()
+    assert cache.get_or_compute(submission("s1"), lambda: None) == (None, False)
+    assert cache.get_or_compute(submission("s2"), lambda: {}) == ({}, False)
+    third = submission("s3")
+    assert cache.get_or_compute(third, lambda: assignment_for(third)) == (assignment_for(third), False)
+    assert cache.stats()["misses"] == 3
+
+
+def test_concurrent_students_wait_and_take_over_after_failure():
+    cache = GroupingCache()
+    calls = []
+    lock = threading.Lock()
+    results = {}
+
+    def grade(folder):
+        paths = submission(folder)
+
+        def compute():
+            with lock:
+                calls.append(folder)
+                failed = len(calls) == 1
+            time.sleep(0.05)
+            return None if failed else assignment_for(paths)
+
+        results[folder] = cache.get_or_compute(paths, compute)
+
+    threads = [threading.Thread(target=grade, args=(f"s{i}",)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 第一次分组失败后由一个等待的学生重新分组，其余学生复用
+    assert len(calls) == 2
+    assert sorted(hit for _, hit in results.values()) == [False, False, True, True, True]
+    stats = cache.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 2 and stats["layouts"] == 1
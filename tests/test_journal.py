@@ -0,0 +1,32 @@
+from tools.journal import GradingJournal
+
+
+def test_records_are_keyed_by_relative_path(tmp_path):
+    journal = GradingJournal(str(tmp_path), "run1")
+    journal.append("a/1_张三.zip", 100, 1.5, {"score": 60})
+    journal.append("late/1_张三.zip", 200, 2.5, {"score": 70})
+    journal.append("a/1_张三.zip", 100, 1.5, {"score": 80})
+
+    completed = GradingJournal(str(tmp_path), "run1").load()
+    assert set(completed) == {"a/1_张三.zip", "late/1_张三.zip"}
+    assert completed["a/1_张三.zip"]["result"] == {"score": 80}
+
+
+def test_changed_files_do_not_match():
+    record = {"path": "a.zip", "size": 100, "mtime": 1.5, "result": {}}
+    assert GradingJournal.matches(record, 100, 1.5)
+    assert not GradingJournal.matches(record, 101, 1.5)
+    assert not GradingJournal.matches(record, 100, 2.0)
+    assert not GradingJournal.matches(None, 100, 1.5)
+
+
+def test_partial_trailing_line_is_ignored_and_terminated(tmp_path):
+    journal = GradingJournal(str(tmp_path), "run1")
+    journal.append("a.zip", 1, 1.0, {"score": 60})
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"path": "b.zip", "size"')
+
+    reopened = GradingJournal(str(tmp_path), "run1")
+    assert set(reopened.load()) == {"a.zip"}
+    reopened.append("c.zip", 1, 1.0, {"score": 70})
+    assert set(reopened.load()) == {"a.zip", "c.zip"}
@@ -0,0 +1,28 @@
+from tools.local_grouping import group_files_locally
+
+
+def test_groups_each_main_with_its_includes():
+    contents = {
+        "hw/q1/main.cpp": '#include "point.h"\nint main() { return 0; }\n',
+        "hw/q1/point.h": "struct Point {};\n",
+        "hw/q2/main.cpp": "int main() { return 1; }\n",
+    }
+    grouped = group_files_locally(contents, 2)
+    assert list(grouped) == ["q1", "q2"]
+    assert "//=== point.h ===" in grouped["q1"] and "//=== main.cpp ===" in grouped["q1"]
+    assert "point.h" not in grouped["q2"]
+
+
+def test_groups_by_directory_without_main():
+    contents = {"q1/a.cpp": "int f() { return 1; }\n", "q2/b.cpp": "int g() { return 2; }\n"}
+    grouped = group_files_locally(contents, 2)
+    assert grouped == {
+        "q1": "//=== a.cpp ===\nint f() { return 1; }\n\n\n",
+        "q2": "//=== b.cpp ===\nint g() { return 2; }\n\n\n",
+    }
+
+
+def test_ambiguous_submission_is_left_to_the_llm():
+    contents = {name: "int main() {}\n" for name in ("a.cpp", "b.cpp", "c.cpp")}
+    assert group_files_locally(contents, 2) is None
+    assert group_files_locally({}, 2) is None
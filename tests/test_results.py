@@ -0,0 +1,50 @@
+import csv
+
+from main import merge_result_files, save_results_to_csv
+from tools.result_writer import ResultStreamWriter
+
+
+def student(student_id, name, score):
+    return {"student_id": student_id, "student_name": name, "score": score, "feedback": f"{name}的评语"}
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return [(row['学号'], row['姓名'], row['得分']) for row in csv.DictReader(f)]
+
+
+def write_shard(tmp_path, name, entries):
+    writer = ResultStreamWriter(str(tmp_path / f"{name}.csv"), formats=("csv", "jsonl"))
+    for path, result in entries:
+        writer.write(path.rsplit("/", 1)[-1], result, path)
+    writer.finalize([result for _, result in entries])
+    return writer.paths
+
+
+def test_jsonl_shards_merge_in_relative_path_order(tmp_path):
+    first = write_shard(tmp_path, "shard0", [
+        ("late/20230001_张三.zip", student("20230001", "张三", 60)),
+        ("a/20230003_王五.zip", student("20230003", "王五", 80)),
+    ])
+    second = write_shard(tmp_path, "shard1", [
+        ("a/20230001_张三.zip", student("20230001", "张三", 90)),
+    ])
+    output = tmp_path / "merged.csv"
+
+    assert merge_result_files([first["jsonl"], second["jsonl"]], str(output)) == 3
+    # 同一学生的两份提交都保留
+    assert read_rows(output) == [
+        ("20230001", "张三", "90"),
+        ("20230003", "王五", "80"),
+        ("20230001", "张三", "60"),
+    ]
+
+
+def test_csv_inputs_merge_by_student_id(tmp_path):
+    first, second = tmp_path / "a.csv", tmp_path / "b.csv"
+    save_results_to_csv([student("20230003", "王五", 80), student("20230001", "张三", 60)], output_file=str(first))
+    save_results_to_csv([student("20230001", "张三", 90)], output_file=str(second))
+    output = tmp_path / "merged.csv"
+
+    assert merge_result_files([str(first), str(second)], str(output)) == 3
+    assert [row[0] for row in read_rows(output)] == ["20230001", "20230001", "20230003"]
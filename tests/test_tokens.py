@@ -0,0 +1,36 @@
+from tools.tokens import estimate_tokens, fit_groups_to_budget
+
+REPEATED = "//=== common.h ===\n" + "int shared = 1; // 公共代码\n" * 40
+
+
+def total(groups):
+    return sum(estimate_tokens(content) for content in groups.values())
+
+
+def test_groups_within_budget_are_unchanged():
+    groups = {"q1": "//=== a.cpp ===\nint a;\n", "q2": "//=== b.cpp ===\nint b;\n"}
+    assert fit_groups_to_budget(groups, 1000) == groups
+
+
+def test_repeated_files_are_kept_only_once():
+    groups = {"q1": REPEATED, "q2": REPEATED + "//=== b.cpp ===\nint b;\n"}
+    fitted = fit_groups_to_budget(groups, total(groups) - 1)
+    assert list(fitted) == ["q1", "q2"]
+    assert fitted["q1"] == REPEATED
+    assert "int shared" not in fitted["q2"] and "int b;" in fitted["q2"]
+
+
+def test_over_budget_groups_are_compacted_then_truncated():
+    groups = {"q1": "//=== a.cpp ===\n" + "int a = 1; // 说明\n" * 200,
+              "q2": "//=== b.cpp ===\n" + "int b = 2;\n" * 200}
+    fitted = fit_groups_to_budget(groups, 300)
+    assert list(fitted) == ["q1", "q2"]
+    assert total(fitted) <= 300
+    assert "说明" not in fitted["q1"]
+
+
+def test_kept_groups_are_preserved_longer():
+    groups = {"q1": "//=== a.cpp ===\n" + "int a = 1;\n" * 200,
+              "q2": "//=== b.cpp ===\n" + "int b = 2;\n" * 200}
+    fitted = fit_groups_to_budget(groups, 600, keep=["q2"])
+    assert estimate_tokens(fitted["q2"]) > estimate_tokens(fitted["q1"])
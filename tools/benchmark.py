@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Dict, List, Any, Optional
+
+sys.path.append('.')
+
+import main
+from tools.mock_llm_server import MockLLMServer
+
+REQUIREMENTS_TEMPLATE = "{index}. 编写程序 q{index}：实现类 Shape{index} 并在 main 中测试"
+
+
+def make_synthetic_class(directory: str, num_students: int, num_questions: int, duplicate_every: int = 0):
+    """
+    生成一个班级的模拟作业ZIP
+
+    每名学生每题一个文件夹，包含 main.cpp 和一对 .h/.cpp，可以被本地分组直接识别，
+    不会触发LLM分组。duplicate_every 大于0时，每隔这么多名学生有一份与前一名学生相同的提交。
+    """
+    os.makedirs(directory, exist_ok=True)
+    for student in range(num_students):
+        variant = student - 1 if duplicate_every and student % duplicate_every == duplicate_every - 1 else student
+        zip_path = os.path.join(directory, f"2023{student:06d}学生{student}.zip")
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for q in range(1, num_questions + 1):
+                zf.writestr(f"作业/q{q}/shape{q}.h", (
+                    f"#pragma once\nclass Shape{q} {{\npublic:\n    Shape{q}(double size);\n"
+                    f"    double area() const;\nprivate:\n    double size_;\n}};\n"
+                ))
+                zf.writestr(f"作业/q{q}/shape{q}.cpp", (
+                    f'#include "shape{q}.h"\n\nShape{q}::Shape{q}(double size) : size_(size) {{}}\n\n'
+                    f"double Shape{q}::area() const {{\n    // 学生 {variant} 的实现\n"
+                    f"    return size_ * size_ * {variant % 7 + q};\n}}\n"
+                ))
+                zf.writestr(f"作业/q{q}/main.cpp", (
+                    f'#include <iostream>\n#include "shape{q}.h"\n\nint main() {{\n'
+                    f"    Shape{q} shape({variant + q});\n"
+                    f'    std::cout << "面积: " << shape.area() << std::endl;\n    return 0;\n}}\n'
+                ))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """线性插值的分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_benchmark(
+    num_students: int = 100,
+    num_questions: int = 3,
+    grading_mode: str = "per_question",
+    max_workers: int = main.DEFAULT_MAX_WORKERS,
+    latency_ms: float = 800.0,
+    latency_sigma: float = 0.5,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    malformed_rate: float = 0.0,
+    structured_output: bool = False,
+    explanation_chars: int = 0,
+    chunk_interval_ms: float = 0.0,
+    duplicate_every: int = 0,
+    seed: Optional[int] = 0
+) -> Dict[str, Any]:
+    """
+    在临时目录中生成模拟班级，对模拟LLM服务运行完整的批改流程
+
+    Returns:
+        吞吐量、每名学生批改耗时的分位数、各阶段耗时和LLM请求统计
+    """
+    workdir = tempfile.mkdtemp(prefix="grading_bench_")
+    previous_cwd = os.getcwd()
+    requirements = "\n".join(REQUIREMENTS_TEMPLATE.format(index=q) for q in range(1, num_questions + 1))
+    try:
+        class_dir = os.path.join(workdir, "class")
+        make_synthetic_class(class_dir, num_students, num_questions, duplicate_every)
+        # 流程使用相对路径保存中间文件和结果，切换到临时目录避免污染当前目录
+        os.chdir(workdir)
+
+        server = MockLLMServer(
+            latency_ms=latency_ms,
+            latency_sigma=latency_sigma,
+            error_rate=error_rate,
+            rate_limit_rate=rate_limit_rate,
+            retry_after=min(1.0, latency_ms / 1000),
+            malformed_rate=malformed_rate,
+            explanation_chars=explanation_chars,
+            chunk_interval_ms=chunk_interval_ms,
+            seed=seed
+        )
+        events = []
+        with server:
+            start = time.perf_counter()
+            for chunk in main.process_homework_workflow(
+                class_dir, requirements, num_questions, "实验",
+                server.base_url, "mock", "mock-key",
+                max_workers=max_workers, grading_mode=grading_mode, structured_output=structured_output
+            ):
+                events.append(json.loads(chunk))
+            elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    success = next((event for event in events if event["type"] == "success"), None)
+    # 每名学生完成时的事件带有该学生各阶段的耗时
+    student_timings = [event["timings"] for event in events if "timings" in event and event["type"] == "info"]
+    latencies = [timings["total"] for timings in student_timings]
+    student_stages = {}
+    for timings in student_timings:
+        for stage, seconds in timings.items():
+            if stage != "total":
+                student_stages[stage] = student_stages.get(stage, 0.0) + seconds
+    graded = len(latencies)
+    return {
+        "students": num_students,
+        "questions": num_questions,
+        "grading_mode": grading_mode,
+        "max_workers": max_workers,
+        "succeeded": success is not None,
+        "errors": sum(1 for event in events if event["type"] == "error"),
+        "elapsed_seconds": round(elapsed, 3),
+        "students_per_minute": round(graded / elapsed * 60, 2) if elapsed else 0.0,
+        "student_latency_p50": round(percentile(latencies, 0.5), 3),
+        "student_latency_p95": round(percentile(latencies, 0.95), 3),
+        "stages": success.get("timings") if success else None,
+        "student_stages": {stage: round(seconds, 3) for stage, seconds in student_stages.items()},
+        "llm": server.stats(),
+        "reasked_students": sum(1 for event in events if event["type"] == "warning" and "已追问" in event["message"]),
+        "throttle": success.get("throttle") if success else None,
+        "tokens": success.get("tokens") if success else None
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"学生数: {report['students']}，题目数: {report['questions']}，"
+          f"批改方式: {report['grading_mode']}，并发数: {report['max_workers']}")
+    print(f"总耗时: {report['elapsed_seconds']} 秒，吞吐量: {report['students_per_minute']} 人/分钟")
+    print(f"每名学生批改耗时: p50 {report['student_latency_p50']} 秒，p95 {report['student_latency_p95']} 秒")
+    if report["stages"]:
+        print("流程各阶段耗时（秒）: " + "，".join(f"{name} {seconds}" for name, seconds in report["stages"].items()))
+    print("学生各阶段累计耗时（秒）: " +
+          "，".join(f"{name} {seconds}" for name, seconds in report["student_stages"].items()))
+    print(f"LLM请求: {report['llm']}")
+    if report["tokens"]:
+        tokens = report["tokens"]
+        print(f"token用量: 提示词 {tokens['prompt_tokens']}（命中上下文缓存 {tokens['cached_tokens']}，"
+              f"占 {tokens['cached_ratio']:.1%}），输出 {tokens['completion_tokens']}"
+              + (f"，{tokens['estimated_calls']} 次提前停止的调用为估算值" if tokens.get("estimated_calls") else ""))
+    if report["reasked_students"]:
+        print(f"回答格式有误、经追问补全的学生: {report['reasked_students']} 名")
+    if report["throttle"]:
+        print(f"重试统计: {report['throttle']}")
+    if not report["succeeded"] or report["errors"]:
+        print(f"警告: 批改未全部成功，错误事件 {report['errors']} 条")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="使用模拟LLM服务测量批改流程的吞吐量")
+    parser.add_argument("--students", type=int, default=100, help="模拟的学生数（默认：100）")
+    parser.add_argument("--questions", type=int, default=3, help="每份作业的题目数（默认：3）")
+    parser.add_argument("--mode", choices=main.GRADING_MODES, default="per_question", help="批改方式")
+    parser.add_argument("--workers", type=int, default=main.DEFAULT_MAX_WORKERS, help="同时批改的学生数")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="模拟LLM响应时间中位数，毫秒")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="响应时间对数正态分布的sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟500错误的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="模拟429限流的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="模拟单题评分回复漏掉分数的比例")
+    parser.add_argument("--structured-output", action="store_true", help="单题评分使用JSON输出模式")
+    parser.add_argument("--explanation-chars", type=int, default=0,
+                        help="模拟单题评分标签之后的解释文字长度，用于比较 stream 方式的提前停止")
+    parser.add_argument("--chunk-interval-ms", type=float, default=0.0, help="模拟流式响应相邻两块的间隔，毫秒")
+    parser.add_argument("--duplicate-every", type=int, default=0, help="每隔多少名学生出现一份重复提交，0表示不重复")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--json", help="把结果写入JSON文件，可作为之后的 --baseline")
+    parser.add_argument("--baseline", help="与之前保存的JSON结果比较吞吐量")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许吞吐量比基线下降的比例（默认：0.2）")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        num_students=args.students,
+        num_questions=args.questions,
+        grading_mode=args.mode,
+        max_workers=args.workers,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        structured_output=args.structured_output,
+        explanation_chars=args.explanation_chars,
+        chunk_interval_ms=args.chunk_interval_ms,
+        duplicate_every=args.duplicate_every,
+        seed=args.seed
+    )
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        floor = baseline["students_per_minute"] * (1 - args.tolerance)
+        if report["students_per_minute"] < floor:
+            print(f"性能回退: 吞吐量 {report['students_per_minute']} 人/分钟，"
+                  f"低于基线 {baseline['students_per_minute']} 的 {1 - args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
+        print(f"吞吐量未低于基线（{baseline['students_per_minute']} 人/分钟）")
+
+    if not report["succeeded"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,51 @@
+import hashlib
+import re
+import threading
+from concurrent.futures import Future
+from typing import Optional, Tuple
+
+from tools.local_grouping import strip_cpp_comments
+
+
+def normalize_code(code: str) -> str:
+    """去除注释和所有空白字符，只保留影响代码含义的部分"""
+    return re.sub(r'\s+', '', strip_cpp_comments(code))
+
+
+class SubmissionDeduplicator:
+    """
+    在一次批改运行中识别不同学生之间相同的作业分组
+
+    分组内容去除注释和空白后计算哈希，第一个提交该内容的学生负责批改，
+    之后提交相同内容的学生直接复用其结果。可以在多个线程中共享同一个实例。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def fingerprint(content: str) -> str:
+        """计算分组内容的指纹"""
+        return hashlib.sha256(normalize_code(content).encode('utf-8')).hexdigest()
+
+    def claim(self, content: str, owner: str) -> Tuple[Future, Optional[str]]:
+        """
+        登记一个分组的内容
+
+        Args:
+            content: 分组内容
+            owner: 提交者标识
+
+        Returns:
+            (结果Future, 最早提交者)。最早提交者为None表示调用方是第一个提交者，
+            无论批改是否出错都必须调用 set_result，否则其他提交相同内容的学生会一直等待；
+            批改失败时结果为None，等待者自行批改。
+        """
+        key = self.fingerprint(content)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = (owner, Future())
+                return self._entries[key][1], None
+            return entry[1], entry[0]
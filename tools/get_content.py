@@ -2,6 +2,54 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import codecs
+
+# 按顺序检查的BOM，UTF-32 LE 的BOM以 UTF-16 LE 的BOM开头，必须先检查
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+def decode_source(data):
+    """
+    解码源文件字节，只处理内存中的字节，不重复读取文件
+
+    依次根据BOM、UTF-8 有效性判断编码，否则按 GB18030（兼容 GBK 和 GB2312）解码，
+    仍失败时使用 latin-1（任何字节都能解码）。每种编码最多尝试一次，成功的结果直接返回。
+
+    Returns:
+        tuple: (文本内容, 使用的编码)
+    """
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return data.decode(encoding), encoding
+    if data.isascii():
+        return data.decode('ascii'), 'utf-8'
+    for encoding in ('utf-8', 'gb18030'):
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return data.decode('latin-1'), 'latin-1'
+
+def decode_submission(files):
+    """
+    一次解码一份作业的全部源文件
+
+    Args:
+        files (dict): 文件路径到原始字节的映射
+
+    Returns:
+        tuple: (文件路径到文本内容的映射, 文件路径到所用编码的映射)
+    """
+    contents = {}
+    encodings = {}
+    for path, data in files.items():
+        contents[path], encodings[path] = decode_source(data)
+    return contents, encodings
 
 def get_cpp_content(file_path):
     """
@@ -16,27 +64,17 @@ def get_cpp_content(file_path):
     if not (file_path.endswith('.cpp') or file_path.endswith('.h')):
         print("警告: 输入的文件可能不是C++文件或头文件")
     
-    # 尝试多种编码方式读取文件
-    encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
-    
-    for encoding in encodings:
-        try:
-            with open(file_path, 'r', encoding=encoding) as file:
-                content = file.read()
-            print(f"成功使用 {encoding} 编码读取文件 {file_path}")
-            return content
-        except UnicodeDecodeError:
-            print(f"使用 {encoding} 编码读取文件失败")
-            continue
-        except FileNotFoundError:
-            print(f"错误: 找不到文件 '{file_path}'")
-            return None
-        except Exception as e:
-            print(f"读取文件时出错: {e}")
-            continue
+    try:
+        with open(file_path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        print(f"错误: 找不到文件 '{file_path}'")
+        return None
+    except Exception as e:
+        print(f"读取文件时出错: {e}")
+        return None
     
-    print(f"错误: 无法使用任何支持的编码读取文件 '{file_path}'")
-    return None
+    return decode_source(data)[0]
 
 def main():
     if len(sys.argv) != 2:
@@ -51,6 +51,50 @@ def extract_and_list_files(zip_path, extract_to=None, cleanup=True):
             import shutil
             shutil.rmtree(temp_dir)
 
+def decode_member_name(info):
+    """
+    解码ZIP成员的文件名
+
+    未设置UTF-8标志位的文件名被zipfile按cp437解码，
+    Windows下压缩的中文文件名实际是GBK编码，需要还原。
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def read_source_files(zip_path, extensions=('.cpp', '.h')):
+    """
+    直接从ZIP中读取源文件内容，不解压到磁盘
+
+    Args:
+        zip_path: ZIP文件路径
+        extensions: 需要读取的文件扩展名
+
+    Returns:
+        dict: ZIP内相对路径（已解码文件名）到文件原始字节的映射
+    """
+    if not os.path.isfile(zip_path):
+        raise FileNotFoundError(f"ZIP 文件不存在: {zip_path}")
+
+    sources = {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            file_name = decode_member_name(info)
+            # 跳过 macOS 压缩时附带的元数据文件
+            if file_name.startswith('__MACOSX/') or os.path.basename(file_name).startswith('._'):
+                continue
+            if not file_name.endswith(extensions):
+                continue
+            with zip_ref.open(info) as member:
+                sources[file_name] = member.read()
+    return sources
+
 def main():
     parser = argparse.ArgumentParser(description="解压 ZIP 文件并列出所有普通文件（非文件夹）")
     parser.add_argument("zip_file", help="输入的 ZIP 文件路径")
@@ -4,15 +4,39 @@ import re
 import json
 from tools.llm import Qwen3LLM
 
-def group_files_by_question(contents: Dict[str, str],requirements) -> Dict[str, str]:
+def group_files_by_question(contents: Dict[str, str],requirements, cache=None, throttle=None, usage=None,
+                            llm: Optional[Qwen3LLM] = None) -> Dict[str, str]:
     """
     使用LLM对文件进行分组，将属于同一题目的CPP文件内容合并
     
+    参数与 assign_files_by_question 相同
+        
+    Returns:
+        分组后的文件内容，键为组标识，值为合并后的内容
+    """
+    assignment = assign_files_by_question(contents, requirements, cache=cache, throttle=throttle, usage=usage,
+                                          llm=llm)
+    if assignment is None:
+        # 如果LLM分组失败，则每个文件独立成组
+        return create_default_groups(contents)
+    return merge_groups(assignment, contents)
+
+
+def assign_files_by_question(contents: Dict[str, str], requirements, cache=None, throttle=None, usage=None,
+                             llm: Optional[Qwen3LLM] = None) -> Optional[Dict[str, List[str]]]:
+    """
+    使用LLM判断每个文件属于哪道题
+    
     Args:
         contents: 文件路径到内容的映射
+        cache: 可选的LLM响应缓存
+        throttle: 可选的LLM请求流量控制
+        usage: 可选的token用量合计
+        llm: 可选的LLM实例（通常来自本次运行共享的 LLMClientRegistry，与评分使用相同的密钥、
+            base_url 和模型）；为None时按 cache、throttle、usage 和环境变量中的密钥新建
         
     Returns:
-        分组后的文件内容，键为组标识，值为合并后的内容
+        各组包含的文件路径，键为组标识；LLM调用失败或响应中没有有效分组时返回None
     """
     if not contents:
         return {}
@@ -24,18 +48,18 @@ def group_files_by_question(contents: Dict[str, str],requirements) -> Dict[str,
         file_name = os.path.basename(file_path)
         file_descriptions.append(f"文件路径: {file_path}文件名: {file_name}\n内容预览: {content[:200]}...\n")
     
-    # 创建LLM提示
+    # 创建LLM提示：作业要求和分组规则在前，每个学生不同的文件列表放在最后，
+    # 使同一次运行中各学生的提示词共享相同的前缀
     prompt = f"""
-作为一名专业的C++编程老师，请仔细分析以下残缺的C++作业文件。
+作为一名专业的C++编程老师，请仔细分析最后给出的残缺的C++作业文件。
 
-文件列表:
-{chr(10).join(file_descriptions)}
-/n
-这是本次作业要求："/n{requirements}/n"
-前面提到的文件列表实际上都是关于上述作业要求的作答文件，
+这是本次作业要求：
+"{requirements}"
+
+文件列表中的文件实际上都是关于上述作业要求的作答文件，
 1.先根据文件路径看一下是否有明显题目归类，比如几个文件来自同一文件夹，他们很可能是属于同一类题。
 2.再根据文件内容和作业要求进一步确认，将不同的作业文件进行归类到对应题目。
-只需返回文件名。/n
+只需返回文件名。
 
 请按照以下格式返回分组结果：
 [<question>题目序号</question>, <files>[文件名1, 文件名2, ...]</files>]
@@ -54,9 +78,14 @@ def group_files_by_question(contents: Dict[str, str],requirements) -> Dict[str,
 有些题目有依赖关系，比如题目2是题目1的扩展，题目3是题目2的扩展
 你要分辨清楚这些依赖关系，题目依然要分组，但是题目1的组的文件也要加入题目2中，题目2的组的文件也要加入题目3中
 也就是题目2的组的文件 = 题目1的组的文件 + 题目2的组的文件
+
+=========================================
+文件列表:
+{chr(10).join(file_descriptions)}
 """
     
-    llm = Qwen3LLM()
+    if llm is None:
+        llm = Qwen3LLM(cache=cache, throttle=throttle, usage=usage)
     messages = [
         {"role": "system", "content": "你是一个专业的C++编程老师，善于分析学生提交的作业文件结构。"},
         {"role": "user", "content": prompt}
@@ -67,20 +96,29 @@ def group_files_by_question(contents: Dict[str, str],requirements) -> Dict[str,
         print(f"LLM文件分组结果: {response}")
         
         # 解析LLM响应
-        grouped_files = parse_grouping_response(response, contents)
-        return grouped_files
+        assignment = parse_grouping_assignment(response, contents)
+        if not assignment:
+            print("LLM分组结果中没有有效分组")
+            return None
+        return assignment
         
     except Exception as e:
         print(f"LLM分组失败: {e}")
-        # 如果LLM分组失败，则每个文件独立成组
-        return create_default_groups(contents)
+        return None
 
 
 def parse_grouping_response(response: str, contents: Dict[str, str]) -> Dict[str, str]:
     """
     解析LLM的分组响应
     """
-    grouped_contents = {}
+    return merge_groups(parse_grouping_assignment(response, contents), contents)
+
+
+def parse_grouping_assignment(response: str, contents: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    解析LLM的分组响应，返回各组包含的文件路径（只保留存在的文件）
+    """
+    assignment = {}
     
     # 改进的正则表达式
     pattern = r'\[<question>([^<]+)</question>\s*,\s*<files>(.*?)</files>\]'
@@ -89,7 +127,7 @@ def parse_grouping_response(response: str, contents: Dict[str, str]) -> Dict[str
     
     if not matches:
         print("未找到有效的分组格式，返回空分组")
-        return grouped_contents  # 返回空字典，即丢弃所有文件
+        return assignment  # 返回空字典，即丢弃所有文件
     
     # 创建文件名到路径的映射
     filename_to_path = {os.path.basename(path): path for path in contents.keys()}
@@ -114,25 +152,32 @@ def parse_grouping_response(response: str, contents: Dict[str, str]) -> Dict[str
             
         print(f"题目 '{group_name}': {file_names}")
         
-        # 合并同一组的文件内容
-        merged_content = ""
-        found_files = 0
+        paths = []
         for file_name in file_names:
             if file_name in filename_to_path:
-                file_path = filename_to_path[file_name]
-                content = contents[file_path]
-                merged_content += f"//=== {file_name} ===\n{content}\n\n"
-                found_files += 1
+                paths.append(filename_to_path[file_name])
             else:
                 print(f"警告: 文件 '{file_name}' 在提取的文件中不存在")
         
-        if merged_content and found_files > 0:
-            grouped_contents[group_name] = merged_content
-            print(f"分组 '{group_name}' 成功合并 {found_files} 个文件")
+        if paths:
+            assignment[group_name] = paths
+            print(f"分组 '{group_name}' 成功合并 {len(paths)} 个文件")
         else:
             print(f"警告: 分组 '{group_name}' 没有找到有效文件")
     
     # 不再处理未被分组的文件，直接丢弃
+    return assignment
+
+
+def merge_groups(assignment: Dict[str, List[str]], contents: Dict[str, str]) -> Dict[str, str]:
+    """按分组合并文件内容，每个文件前加上 //=== 文件名 === 标记"""
+    grouped_contents = {}
+    for group_name, paths in assignment.items():
+        merged_content = ""
+        for file_path in paths:
+            merged_content += f"//=== {os.path.basename(file_path)} ===\n{contents[file_path]}\n\n"
+        if merged_content:
+            grouped_contents[group_name] = merged_content
     return grouped_contents
 
 
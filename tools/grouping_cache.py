@@ -0,0 +1,133 @@
+import hashlib
+import posixpath
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def layout_keys(paths: Iterable[str]) -> Dict[str, str]:
+    """
+    把一份提交中的文件路径规范化为目录结构的键
+
+    统一分隔符和大小写，并去掉所有文件共同的上层目录（通常是以学号、姓名命名的外层文件夹），
+    使不同学生的相同目录结构得到相同的键。
+
+    Returns:
+        原路径到规范化键的映射
+    """
+    paths = list(paths)
+    parts = {path: [part for part in path.replace('\\', '/').strip().lower().split('/') if part] for path in paths}
+    if not parts:
+        return {}
+    # 共同的上层目录只比较目录部分，不包含文件名
+    common = 0
+    directories = [p[:-1] for p in parts.values()]
+    shortest = min(len(d) for d in directories)
+    while common < shortest and len({d[common] for d in directories}) == 1:
+        common += 1
+    return {path: posixpath.join(*p[common:]) for path, p in parts.items()}
+
+
+def _hash_keys(keys: Iterable[str]) -> str:
+    return hashlib.sha256("\n".join(sorted(keys)).encode('utf-8')).hexdigest()
+
+
+def layout_fingerprint(paths: Iterable[str]) -> str:
+    """提交目录结构的指纹：规范化后的相对路径排序后的哈希"""
+    return _hash_keys(layout_keys(paths).values())
+
+
+class GroupingCache:
+    """
+    在一次批改运行中按提交的目录结构复用LLM分组结果
+
+    同一次作业的学生大多提交相同的目录骨架（如 实验3/q1/main.cpp、q2/...）。第一个提交某种目录结构的学生
+    调用LLM分组，结果按目录结构的键保存；之后目录结构相同的学生直接套用，不再调用LLM。
+    同时提交相同结构的学生等待第一个学生的结果，不会重复调用。可以在多个线程中共享同一个实例。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Future] = {}
+        self.hits = 0
+        self.waited = 0
+        self.misses = 0
+
+    def get_or_compute(
+        self,
+        paths: Iterable[str],
+        compute: Callable[[], Optional[Dict[str, List[str]]]]
+    ) -> Tuple[Optional[Dict[str, List[str]]], bool]:
+        """
+        返回这份提交的分组
+
+        Args:
+            paths: 提交中的文件路径
+            compute: 调用LLM分组的函数，返回各组包含的文件路径，失败时返回None。
+                失败或为空的分组只用于当前学生，不会被复用
+
+        Returns:
+            (各组包含的文件路径, 是否复用了缓存)
+        """
+        keys = layout_keys(paths)
+        if len(set(keys.values())) != len(keys):
+            # 规范化后有重名的路径（如只有大小写不同），无法一一对应，不使用缓存
+            with self._lock:
+                self.misses += 1
+            return compute(), False
+        fingerprint = _hash_keys(keys.values())
+        while True:
+            with self._lock:
+                future = self._entries.get(fingerprint)
+                owner = future is None
+                if owner:
+                    future = self._entries[fingerprint] = Future()
+            if owner:
+                break
+            in_flight = not future.done()
+            cached = future.result()
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                    if in_flight:
+                        self.waited += 1
+                by_key = {key: path for path, key in keys.items()}
+                return {group: [by_key[key] for key in group_keys] for group, group_keys in cached.items()}, True
+            # 先分组的学生失败了，其记录已被移除，重新登记，可能由当前学生负责分组
+
+        with self._lock:
+            self.misses += 1
+        try:
+            assignment = compute()
+        except BaseException:
+            self._forget(fingerprint, future)
+            raise
+        if self._reusable(assignment):
+            future.set_result({
+                group: [keys[path] for path in group_paths] for group, group_paths in assignment.items()
+            })
+        else:
+            self._forget(fingerprint, future)
+        return assignment, False
+
+    @staticmethod
+    def _reusable(assignment: Optional[Dict[str, List[str]]]) -> bool:
+        """
+        非空的分组都可以复用
+
+        分组提示词允许LLM丢弃与作业无关的零散文件，因此不要求分组包含提交中的所有文件；
+        复用时目录结构相同，被丢弃的文件也相同。
+        """
+        return bool(assignment)
+
+    def _forget(self, fingerprint: str, future: Future):
+        """分组失败时移除该结构的记录，等待的学生重新登记，由其中一人再次调用LLM"""
+        with self._lock:
+            if self._entries.get(fingerprint) is future:
+                del self._entries[fingerprint]
+        future.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        """hits 为复用的次数（其中 waited 次等待了进行中的分组），misses 为实际调用LLM分组的次数"""
+        with self._lock:
+            return {"hits": self.hits, "waited": self.waited, "misses": self.misses, "layouts": len(self._entries)}
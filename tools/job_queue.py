@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Callable, Iterator
+
+
+class Job:
+    """
+    一个后台批改任务
+
+    任务产生的每条进度事件（NDJSON行）都按顺序保存，客户端断线后可以从任意偏移量重放。
+    """
+
+    def __init__(self, job_id: str, params: Dict[str, Any]):
+        self.job_id = job_id
+        self.params = params
+        self.status = "queued"
+        self.events: List[str] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def append(self, event: str):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, status: str, error: Optional[str] = None):
+        with self._cond:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def iter_events(self, offset: int = 0, timeout: float = 15.0) -> Iterator[Optional[str]]:
+        """
+        从 offset 开始依次产出事件，任务结束且全部产出后停止
+
+        超过 timeout 秒没有新事件时产出None，调用方可借此发送保活数据或检测断线。
+        """
+        while True:
+            with self._cond:
+                if offset >= len(self.events) and not self.done:
+                    self._cond.wait(timeout)
+                pending = self.events[offset:]
+                done = self.done
+            if not pending:
+                if done:
+                    return
+                yield None
+                continue
+            for event in pending:
+                yield event
+            offset += len(pending)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态（不含参数，避免泄露API密钥）"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "events_count": len(self.events),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """
+    后台任务队列：任务由工作线程池执行，与提交任务的HTTP连接无关
+
+    只在内存中保留最近 max_finished 个已结束的任务。
+    """
+
+    def __init__(self, workflow: Callable[..., Iterator[str]], max_workers: int = 2, max_finished: int = 50):
+        """
+        Args:
+            workflow: 产出NDJSON进度事件的生成器函数，以任务参数作为关键字参数调用
+            max_workers: 同时运行的任务数
+            max_finished: 保留的已结束任务数
+        """
+        self.workflow = workflow
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grading-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, **params) -> Job:
+        """提交任务，立即返回"""
+        job = Job(uuid.uuid4().hex[:12], params)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            for chunk in self.workflow(**job.params):
+                job.append(chunk)
+                try:
+                    event = json.loads(chunk)
+                except ValueError:
+                    continue
+                if event.get("type") == "success":
+                    job.result = event
+            job.finish("succeeded" if job.result is not None else "failed")
+        except Exception as e:
+            job.append(json.dumps({
+                "type": "error",
+                "message": f"任务执行失败: {str(e)}"
+            }, ensure_ascii=False) + "\n")
+            job.finish("failed", error=str(e))
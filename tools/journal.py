@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+class GradingJournal:
+    """
+    批改运行的断点日志（只追加的JSON Lines文件）
+
+    每批改完一个学生就写入一行并刷新到磁盘，进程崩溃或连接中断后，
+    使用相同的运行ID重跑即可跳过已经批改完成的学生。
+    记录以ZIP文件相对于搜索目录的路径为键，并保存文件的大小和修改时间，
+    重跑时只有文件未变化才复用记录，学生重新提交后会重新批改。
+    """
+
+    def __init__(self, runs_dir: str, run_id: str):
+        """
+        打开（或创建）运行ID对应的日志
+
+        Args:
+            runs_dir: 保存日志的目录
+            run_id: 运行ID
+        """
+        os.makedirs(runs_dir, exist_ok=True)
+        self.run_id = run_id
+        self.path = os.path.join(runs_dir, f"{run_id}.jsonl")
+        self._lock = threading.Lock()
+        self._terminate_partial_line()
+
+    def _terminate_partial_line(self):
+        """上次运行崩溃时最后一行可能只写了一半，补上换行，避免与新记录粘连"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        读取已完成的记录
+
+        Returns:
+            ZIP文件相对路径到记录（包含 size、mtime 和 result）的映射；同一文件出现多次时以最后一条为准。
+            末尾因崩溃而写了一半的行会被忽略。
+        """
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "path" in record:
+                    completed[record["path"]] = record
+        return completed
+
+    @staticmethod
+    def matches(record: Optional[Dict[str, Any]], size: int, mtime: float) -> bool:
+        """记录是否对应未变化的同一文件"""
+        return record is not None and record.get("size") == size and record.get("mtime") == mtime
+
+    def append(self, path: str, size: int, mtime: float, result: Dict[str, Any]):
+        """
+        追加一个学生的评分结果，并立即刷新到磁盘
+
+        Args:
+            path: ZIP文件相对于搜索目录的路径
+            size: 文件大小
+            mtime: 文件修改时间
+            result: 评分结果
+        """
+        record = {"path": path, "size": size, "mtime": mtime, "result": result, "time": time.time()}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
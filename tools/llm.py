@@ -1,6 +1,53 @@
-from openai import OpenAI
-from typing import Optional, List, Dict, Any
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, Timeout
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+import asyncio
 import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import httpx
+
+from tools.llm_cache import LLMResponseCache
+from tools.metrics import record_llm_call, TokenUsage
+from tools.rate_limit import RequestThrottle
+from tools.tokens import estimate_message_tokens, estimate_tokens
+
+# 整个运行共享的HTTP连接池的默认配置
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+
+def usage_to_dict(usage) -> Optional[Dict[str, int]]:
+    """把响应中的 usage 对象转换为字典"""
+    if usage is None:
+        return None
+    # 命中服务端上下文缓存的提示词token数，不支持的服务不返回该字段
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached_tokens = details.get("cached_tokens")
+    else:
+        cached_tokens = getattr(details, "cached_tokens", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+        "cached_tokens": cached_tokens
+    }
+
+
+def estimate_usage(messages: List[Dict[str, str]], content: str) -> Dict[str, Any]:
+    """服务端没有返回 usage 时（如提前关闭的流）按提示词和已收到的回答估算，带 estimated 标记"""
+    prompt_tokens = estimate_message_tokens(messages)
+    completion_tokens = estimate_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cached_tokens": None,
+        "estimated": True
+    }
 
 
 class Qwen3LLM:
@@ -12,7 +59,11 @@ class Qwen3LLM:
         self,
         api_key: Optional[str] = None,
         base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1",
-        model_name: str = "qwen3-235b-a22b"
+        model_name: str = "qwen3-235b-a22b",
+        cache: Optional[LLMResponseCache] = None,
+        throttle: Optional[RequestThrottle] = None,
+        usage: Optional[TokenUsage] = None,
+        client=None
     ):
         """
         初始化Qwen3 LLM
@@ -21,6 +72,10 @@ class Qwen3LLM:
             api_key: 阿里云API密钥，如果为None则从环境变量DASHSCOPE_API_KEY获取
             base_url: API基础URL
             model_name: 模型名称
+            cache: 可选的响应缓存，命中时不再调用模型
+            throttle: 可选的流量控制（限速、自适应并发和退避重试），通常整个运行共享一个
+            usage: 可选的token用量合计，每次调用的用量都累加到其中，通常整个运行共享一个
+            client: 可选的已有客户端（通常来自 LLMClientRegistry），复用其连接池，为None时新建
         """
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         if not self.api_key:
@@ -30,11 +85,18 @@ class Qwen3LLM:
             
         self.base_url = base_url
         self.model_name = model_name
+        self.cache = cache
+        self.throttle = throttle
+        self.usage = usage
+        # 最近一次 generate 调用的token用量（命中缓存时为None）；
+        # 多个线程/协程共享同一实例时不可靠
+        self.last_usage = None
         
-        # 初始化OpenAI客户端
-        self.client = OpenAI(
+        # 初始化OpenAI客户端；由 throttle 负责重试时关闭客户端自带的重试
+        self.client = client or OpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            **({"max_retries": 0} if throttle is not None else {})
         )
     
     def generate(
@@ -58,12 +120,20 @@ class Qwen3LLM:
         Returns:
             模型生成的文本
         """
+        self.last_usage = None
+        cache_key = self._cache_key(messages, temperature, max_tokens, enable_thinking, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(self.model_name, None, "cache_hit")
+                return cached
+        
+        started = time.perf_counter()
         try:
             # 构造额外参数
             extra_body = {"enable_thinking": enable_thinking}
             
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            response = self._create(
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
@@ -72,10 +142,58 @@ class Qwen3LLM:
                 **kwargs
             )
             
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            self.last_usage = usage_to_dict(getattr(response, "usage", None))
             
         except Exception as e:
+            record_llm_call(self.model_name, time.perf_counter() - started, "error")
             raise Exception(f"调用Qwen3模型时出错: {str(e)}")
+        record_llm_call(self.model_name, time.perf_counter() - started, "ok", self.last_usage)
+        if self.usage is not None:
+            self.usage.add(self.last_usage)
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+    
+    def _create(self, **params):
+        """发起一次 chat.completions 请求，配置了 throttle 时经由其限速和重试"""
+        def request():
+            return self.client.chat.completions.create(model=self.model_name, **params)
+        
+        if self.throttle is None:
+            return request()
+        return self.throttle.call(request, estimate_message_tokens(params["messages"]))
+    
+    @contextmanager
+    def _stream(self, **params):
+        """发起一次流式请求，退出上下文时关闭流；配置了 throttle 时并发名额保持到流关闭"""
+        def request():
+            return self.client.chat.completions.create(model=self.model_name, **params)
+        
+        if self.throttle is not None:
+            with self.throttle.stream(request, estimate_message_tokens(params["messages"])) as response:
+                yield response
+            return
+        response = request()
+        try:
+            yield response
+        finally:
+            response.close()
+    
+    def _cache_key(self, messages, temperature, max_tokens, enable_thinking, **kwargs) -> Optional[str]:
+        """未启用缓存时返回None"""
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            self.model_name,
+            self.base_url,
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            enable_thinking=enable_thinking,
+            **kwargs
+        )
     
     def stream_generate(
         self,
@@ -98,24 +216,396 @@ class Qwen3LLM:
         Yields:
             模型生成的文本片段
         """
+        started = time.perf_counter()
         try:
             # 构造额外参数
             extra_body = {"enable_thinking": enable_thinking}
             
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            with self._stream(
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 stream=True,  # 流式调用
                 extra_body=extra_body,
                 **kwargs
+            ) as response:
+                for chunk in response:
+                    yield chunk
+                
+        except Exception as e:
+            record_llm_call(self.model_name, time.perf_counter() - started, "error")
+            raise Exception(f"调用Qwen3模型时出错: {str(e)}")
+        record_llm_call(self.model_name, time.perf_counter() - started, "ok")
+
+
+class AsyncQwen3LLM:
+    """
+    Qwen3 LLM 的异步版本，基于 AsyncOpenAI 客户端，便于并发发起多个请求
+
+    客户端绑定创建时所在的事件循环，应在同一个事件循环内创建、使用并关闭：
+
+        async with AsyncQwen3LLM(api_key=...) as llm:
+            text = await llm.agenerate(messages)
+    """
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1",
+        model_name: str = "qwen3-235b-a22b",
+        cache: Optional[LLMResponseCache] = None,
+        throttle: Optional[RequestThrottle] = None,
+        usage: Optional[TokenUsage] = None,
+        client=None
+    ):
+        """
+        初始化异步 Qwen3 LLM
+        
+        Args:
+            api_key: 阿里云API密钥，如果为None则从环境变量DASHSCOPE_API_KEY获取
+            base_url: API基础URL
+            model_name: 模型名称
+            cache: 可选的响应缓存，命中时不再调用模型
+            throttle: 可选的流量控制（限速、自适应并发和退避重试），通常整个运行共享一个
+            usage: 可选的token用量合计，每次调用的用量都累加到其中，通常整个运行共享一个
+            client: 可选的已有客户端（通常来自 LLMClientRegistry），复用其连接池，为None时新建
+        """
+        self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        if not self.api_key:
+            raise ValueError(
+                "请提供API密钥，可以通过参数传递或设置DASHSCOPE_API_KEY环境变量"
+            )
+            
+        self.base_url = base_url
+        self.model_name = model_name
+        self.cache = cache
+        self.throttle = throttle
+        self.usage = usage
+        # 最近一次 generate 调用的token用量（命中缓存时为None）；
+        # 多个线程/协程共享同一实例时不可靠
+        self.last_usage = None
+        
+        # 初始化异步OpenAI客户端；由 throttle 负责重试时关闭客户端自带的重试
+        self._owns_client = client is None
+        self.client = client or AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            **({"max_retries": 0} if throttle is not None else {})
+        )
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def aclose(self):
+        """关闭底层HTTP连接池；共享的客户端由其所有者关闭"""
+        if self._owns_client:
+            await self.client.close()
+    
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: Optional[int] = None,
+        enable_thinking: bool = False,
+        **kwargs
+    ) -> str:
+        """
+        异步生成文本响应，参数与 Qwen3LLM.generate 相同
+        
+        Returns:
+            模型生成的文本
+        """
+        self.last_usage = None
+        cache_key = self._cache_key(messages, temperature, max_tokens, enable_thinking, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(self.model_name, None, "cache_hit")
+                return cached
+        
+        started = time.perf_counter()
+        try:
+            extra_body = {"enable_thinking": enable_thinking}
+            
+            response = await self._create(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=False,
+                extra_body=extra_body,
+                **kwargs
             )
             
-            for chunk in response:
-                yield chunk
+            content = response.choices[0].message.content
+            self.last_usage = usage_to_dict(getattr(response, "usage", None))
+            
+        except Exception as e:
+            record_llm_call(self.model_name, time.perf_counter() - started, "error")
+            raise Exception(f"调用Qwen3模型时出错: {str(e)}")
+        record_llm_call(self.model_name, time.perf_counter() - started, "ok", self.last_usage)
+        if self.usage is not None:
+            self.usage.add(self.last_usage)
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+    
+    _cache_key = Qwen3LLM._cache_key
+    
+    async def _create(self, **params):
+        """发起一次 chat.completions 请求，配置了 throttle 时经由其限速和重试"""
+        def request():
+            return self.client.chat.completions.create(model=self.model_name, **params)
+        
+        if self.throttle is None:
+            return await request()
+        return await self.throttle.acall(request, estimate_message_tokens(params["messages"]))
+    
+    @asynccontextmanager
+    async def _astream(self, **params):
+        """Qwen3LLM._stream 的异步版本"""
+        def request():
+            return self.client.chat.completions.create(model=self.model_name, **params)
+        
+        if self.throttle is not None:
+            async with self.throttle.astream(request, estimate_message_tokens(params["messages"])) as response:
+                yield response
+            return
+        response = await request()
+        try:
+            yield response
+        finally:
+            await response.close()
+    
+    async def astream_until(
+        self,
+        messages: List[Dict[str, str]],
+        stop_when: Callable[[str], bool],
+        temperature: float = 0.3,
+        max_tokens: Optional[int] = None,
+        enable_thinking: bool = False,
+        **kwargs
+    ) -> str:
+        """
+        流式生成，每收到一段文本就用 stop_when 检查已收到的全部文本，满足时立即关闭连接
+
+        适合只需要回答开头部分（如评分标签）的请求：不再等待模型写完剩余内容，
+        也不再为其后的输出token付费。提前停止时服务端不会返回 usage，last_usage 按提示词和已收到的文本估算，
+        并带有 estimated 标记。
+
+        Args:
+            messages: 对话消息列表
+            stop_when: 判断已收到的文本是否足够的函数
+            其余参数与 agenerate 相同
+
+        Returns:
+            已收到的文本（提前停止时为截断的回答）
+        """
+        self.last_usage = None
+        cache_key = self._cache_key(messages, temperature, max_tokens, enable_thinking, early_stop=True, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(self.model_name, None, "cache_hit")
+                return cached
+        
+        started = time.perf_counter()
+        stopped = False
+        try:
+            pieces = []
+            # 退出上下文时关闭连接，提前停止时服务端随即停止生成
+            async with self._astream(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                extra_body={"enable_thinking": enable_thinking},
+                **kwargs
+            ) as response:
+                async for chunk in response:
+                    if getattr(chunk, "usage", None) is not None:
+                        self.last_usage = usage_to_dict(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        pieces.append(chunk.choices[0].delta.content)
+                        if stop_when("".join(pieces)):
+                            stopped = True
+                            break
+            content = "".join(pieces)
+            
+        except Exception as e:
+            record_llm_call(self.model_name, time.perf_counter() - started, "error")
+            raise Exception(f"调用Qwen3模型时出错: {str(e)}")
+        if self.last_usage is None:
+            self.last_usage = estimate_usage(messages, content)
+        record_llm_call(self.model_name, time.perf_counter() - started, "early_stop" if stopped else "ok",
+                        self.last_usage)
+        if self.usage is not None:
+            self.usage.add(self.last_usage)
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+    
+    async def astream_generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        enable_thinking: bool = False,
+        **kwargs
+    ):
+        """
+        异步流式生成文本响应，参数与 Qwen3LLM.stream_generate 相同
+        
+        Yields:
+            模型生成的文本片段
+        """
+        started = time.perf_counter()
+        try:
+            extra_body = {"enable_thinking": enable_thinking}
+            
+            async with self._astream(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                extra_body=extra_body,
+                **kwargs
+            ) as response:
+                async for chunk in response:
+                    yield chunk
                 
         except Exception as e:
+            record_llm_call(self.model_name, time.perf_counter() - started, "error")
             raise Exception(f"调用Qwen3模型时出错: {str(e)}")
+        record_llm_call(self.model_name, time.perf_counter() - started, "ok")
+
+
+class LLMClientRegistry:
+    """
+    一次运行中所有LLM调用共享的客户端
+
+    文件分组、单题评分和总结都使用同一组 API密钥、base_url 和模型，复用同一个保持连接（keep-alive）的
+    HTTP连接池，不再为每个学生新建客户端、重复建立连接和TLS握手。
+
+    同步调用共享一个 OpenAI 客户端；AsyncOpenAI 客户端绑定事件循环，因此异步调用统一提交到
+    registry 自己的后台事件循环中执行（见 run），共享绑定在该循环上的客户端：
+
+        with LLMClientRegistry(api_key=..., base_url=..., model_name=...) as clients:
+            text = clients.llm().generate(messages)
+            results = clients.run(grade_async(clients.async_llm()))
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1",
+        model_name: str = "qwen3-235b-a22b",
+        cache: Optional[LLMResponseCache] = None,
+        throttle: Optional[RequestThrottle] = None,
+        usage: Optional[TokenUsage] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        timeout: float = DEFAULT_TIMEOUT,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    ):
+        """
+        Args:
+            api_key: API密钥，如果为None则从环境变量DASHSCOPE_API_KEY获取
+            base_url: API基础URL
+            model_name: 模型名称
+            cache: 可选的响应缓存
+            throttle: 可选的流量控制
+            usage: 可选的token用量合计
+            max_connections: 同步和异步连接池各自的最大连接数，应不小于同时进行的LLM请求数
+            timeout: 单次请求的超时（秒）
+            connect_timeout: 建立连接的超时（秒）
+        """
+        self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        if not self.api_key:
+            raise ValueError(
+                "请提供API密钥，可以通过参数传递或设置DASHSCOPE_API_KEY环境变量"
+            )
+        self.base_url = base_url
+        self.model_name = model_name
+        self.cache = cache
+        self.throttle = throttle
+        self.usage = usage
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # 超时使用 openai 导出的 Timeout，与 openai 客户端实际使用的HTTP库一致
+        self._timeout = Timeout(timeout, connect=connect_timeout)
+        # 由 throttle 负责重试时关闭客户端自带的重试
+        self._client_options = {"max_retries": 0} if throttle is not None else {}
+        self.client = OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self._timeout,
+            http_client=DefaultHttpxClient(limits=self._limits, timeout=self._timeout),
+            **self._client_options
+        )
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _llm_options(self) -> Dict[str, Any]:
+        return {
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            "model_name": self.model_name,
+            "cache": self.cache,
+            "throttle": self.throttle,
+            "usage": self.usage
+        }
+
+    def llm(self) -> Qwen3LLM:
+        """返回使用共享连接池的同步LLM；实例很轻，每个调用方各用一个，last_usage 互不干扰"""
+        return Qwen3LLM(client=self.client, **self._llm_options())
+
+    def async_llm(self) -> AsyncQwen3LLM:
+        """返回使用共享连接池的异步LLM，只能在 run 提交的协程中使用"""
+        self._ensure_loop()
+        return AsyncQwen3LLM(client=self._async_client, **self._llm_options())
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, name="llm-event-loop", daemon=True)
+            self._loop_thread.start()
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self._timeout,
+                http_client=DefaultAsyncHttpxClient(limits=self._limits, timeout=self._timeout),
+                **self._client_options
+            )
 
+    def run(self, coroutine: Awaitable[Any]) -> Any:
+        """在共享的后台事件循环中运行协程，阻塞当前线程直到完成并返回结果；可从多个线程同时调用"""
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
 
+    def close(self):
+        """关闭连接池和后台事件循环"""
+        with self._lock:
+            loop, thread, async_client = self._loop, self._loop_thread, self._async_client
+            self._loop = self._loop_thread = self._async_client = None
+        if loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(async_client.close(), loop).result()
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+        self.client.close()
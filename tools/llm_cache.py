@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Any
+
+
+class LLMResponseCache:
+    """
+    基于SQLite的LLM响应缓存（按内容寻址）
+
+    缓存键为模型名、base_url、对话消息和采样参数的SHA-256哈希，
+    同样的请求在重跑时直接返回已保存的响应，不再调用LLM。
+    支持按条目存活时间和缓存总大小淘汰，淘汰时优先删除最久未访问的条目。
+    可以在多个线程中共享同一个实例。
+    """
+
+    def __init__(
+        self,
+        path: str = "llm_cache.sqlite3",
+        max_age: Optional[float] = 30 * 24 * 3600,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        evict_interval: int = 100
+    ):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite数据库文件路径
+            max_age: 条目最长保留时间（秒），None表示不按时间淘汰
+            max_bytes: 缓存响应总大小上限（字节），None表示不按大小淘汰
+            evict_interval: 每写入多少条检查一次淘汰
+        """
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        base_url: str,
+        messages: List[Dict[str, str]],
+        **params: Any
+    ) -> str:
+        """
+        计算请求的缓存键
+
+        Args:
+            model_name: 模型名称
+            base_url: API基础URL
+            messages: 对话消息列表
+            **params: 采样参数（temperature、max_tokens、enable_thinking等）
+
+        Returns:
+            十六进制SHA-256哈希
+        """
+        payload = json.dumps(
+            {
+                "model": model_name,
+                "base_url": base_url,
+                "messages": messages,
+                "params": params,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的响应，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """写入响应，空响应不缓存"""
+        if not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            should_evict = self._puts % self.evict_interval == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并在超出大小上限时删除最久未访问的条目"""
+        with self._lock:
+            if self.max_age is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)
+                )
+            if self.max_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed_at"
+                    ).fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中/未命中计数和当前条目数"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
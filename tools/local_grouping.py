@@ -0,0 +1,171 @@
+from typing import Optional, List, Dict, Set
+import posixpath
+import re
+
+# 字符串/字符字面量与注释，字面量原样保留，注释替换为空格
+_COMMENT_PATTERN = re.compile(
+    r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')|(//[^\n]*|/\*.*?\*/)',
+    re.DOTALL
+)
+_INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+_MAIN_PATTERN = re.compile(r'\b(?:int|void)\s+main\s*\(')
+
+
+def strip_cpp_comments(code: str) -> str:
+    """去除C/C++代码中的注释，字符串和字符字面量中的内容保持不变"""
+    return _COMMENT_PATTERN.sub(lambda m: m.group(1) or " ", code)
+
+
+def _natural_key(path: str):
+    """按路径中的数字大小排序，使 q2 排在 q10 之前"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+class _Ambiguous(Exception):
+    """本地分析无法确定唯一的分组结果"""
+
+
+class SubmissionGraph:
+    """
+    一份作业中源文件的结构：哪些文件含 main 函数、每个文件 #include 了哪些本地文件
+    """
+
+    def __init__(self, contents: Dict[str, str]):
+        self.paths = sorted(contents.keys(), key=_natural_key)
+        self.main_files: List[str] = []
+        self.includes: Dict[str, List[str]] = {}
+
+        self._by_basename: Dict[str, List[str]] = {}
+        for path in self.paths:
+            self._by_basename.setdefault(posixpath.basename(path), []).append(path)
+
+        for path in self.paths:
+            code = strip_cpp_comments(contents[path])
+            if path.endswith('.cpp') and _MAIN_PATTERN.search(code):
+                self.main_files.append(path)
+            self.includes[path] = _INCLUDE_PATTERN.findall(code)
+
+    def resolve(self, from_path: str, name: str) -> Optional[str]:
+        """
+        解析 #include "name" 指向的文件
+
+        先按包含者所在目录的相对路径查找，再按文件名在整个作业中查找；
+        找不到（如系统头文件）返回None，同名文件不止一个时无法确定。
+        """
+        candidate = posixpath.normpath(posixpath.join(posixpath.dirname(from_path), name))
+        if candidate in self.includes:
+            return candidate
+        matches = self._by_basename.get(posixpath.basename(name), [])
+        if len(matches) > 1:
+            raise _Ambiguous(f"{from_path} 包含的 {name} 有多个同名文件")
+        return matches[0] if matches else None
+
+    def companion_source(self, header: str) -> Optional[str]:
+        """头文件对应的实现文件（同名且不含 main 的 .cpp），优先同一目录"""
+        stem = posixpath.splitext(header)[0]
+        if stem + '.cpp' in self.includes and stem + '.cpp' not in self.main_files:
+            return stem + '.cpp'
+        matches = [
+            path for path in self._by_basename.get(posixpath.basename(stem) + '.cpp', [])
+            if path not in self.main_files
+        ]
+        if len(matches) > 1:
+            raise _Ambiguous(f"{header} 有多个同名的实现文件")
+        return matches[0] if matches else None
+
+    def closure(self, main_file: str) -> Set[str]:
+        """main 文件及其直接或间接依赖的全部本地文件"""
+        seen = set()
+        stack = [main_file]
+        while stack:
+            path = stack.pop()
+            if path in seen:
+                continue
+            seen.add(path)
+            for name in self.includes[path]:
+                target = self.resolve(path, name)
+                if target is None:
+                    continue
+                stack.append(target)
+                if target.endswith('.h'):
+                    source = self.companion_source(target)
+                    if source is not None:
+                        stack.append(source)
+        return seen
+
+
+def _merge(paths: List[str], contents: Dict[str, str]) -> str:
+    """按 parse_grouping_response 的格式合并一组文件的内容"""
+    merged_content = ""
+    for path in paths:
+        merged_content += f"//=== {posixpath.basename(path)} ===\n{contents[path]}\n\n"
+    return merged_content
+
+
+def _group_by_main(graph: SubmissionGraph, num_questions: int) -> Optional[Dict[str, List[str]]]:
+    """每个含 main 的文件及其依赖为一题"""
+    if len(graph.main_files) != num_questions:
+        return None
+
+    groups = {main_file: graph.closure(main_file) for main_file in graph.main_files}
+
+    # 未被任何 main 引用的文件，只有所在目录恰好有一个 main 时才能确定归属
+    assigned = set().union(*groups.values())
+    main_dirs: Dict[str, List[str]] = {}
+    for main_file in graph.main_files:
+        main_dirs.setdefault(posixpath.dirname(main_file), []).append(main_file)
+    for path in graph.paths:
+        if path in assigned:
+            continue
+        owners = main_dirs.get(posixpath.dirname(path), [])
+        if len(owners) != 1:
+            return None
+        groups[owners[0]].add(path)
+
+    return {
+        f"q{i + 1}": sorted(groups[main_file], key=_natural_key)
+        for i, main_file in enumerate(graph.main_files)
+    }
+
+
+def _group_by_directory(graph: SubmissionGraph, num_questions: int) -> Optional[Dict[str, List[str]]]:
+    """没有 main 函数时，若恰好每题一个文件夹，则按文件夹分组"""
+    if graph.main_files:
+        return None
+    directories: Dict[str, List[str]] = {}
+    for path in graph.paths:
+        directories.setdefault(posixpath.dirname(path), []).append(path)
+    if len(directories) != num_questions:
+        return None
+    return {
+        f"q{i + 1}": files
+        for i, files in enumerate(sorted(directories.values(), key=lambda files: _natural_key(files[0])))
+    }
+
+
+def group_files_locally(contents: Dict[str, str], num_questions: int) -> Optional[Dict[str, str]]:
+    """
+    不调用LLM，根据 main/#include 依赖关系和目录结构对文件分组
+
+    只在分组结果唯一确定时返回，否则返回None，由调用方交给LLM分组。
+
+    Args:
+        contents: ZIP内相对路径到文件内容的映射
+        num_questions: 题目数量
+
+    Returns:
+        与 group_files_by_question 相同格式的分组内容，无法确定时为None
+    """
+    if not contents or num_questions < 1:
+        return None
+
+    try:
+        graph = SubmissionGraph(contents)
+        grouping = _group_by_main(graph, num_questions) or _group_by_directory(graph, num_questions)
+    except _Ambiguous as e:
+        print(f"本地分组无法确定: {e}")
+        return None
+
+    if grouping is None:
+        return None
+    return {name: _merge(paths, contents) for name, paths in grouping.items()}
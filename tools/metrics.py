@@ -0,0 +1,216 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional, Sequence
+
+# 延迟直方图的默认分桶（秒），覆盖从读取ZIP到慢速LLM调用的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(_escape(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """累积分桶的直方图，按标签值分别统计"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数, 总和, 总数]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(_escape(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.label_names, key, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内所有指标的集合，渲染为 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "grading_stage_seconds", "批改流程各阶段耗时（秒）", labels=("stage",)
+)
+STUDENTS_TOTAL = REGISTRY.counter(
+    "grading_students_total", "已批改的学生数", labels=("outcome",)
+)
+LLM_REQUESTS_TOTAL = REGISTRY.counter(
+    "llm_requests_total", "LLM请求数，outcome 为 ok / error / cache_hit / early_stop", labels=("model", "outcome")
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds", "LLM请求耗时（秒，含限速等待和重试）", labels=("model",)
+)
+LLM_TOKENS_TOTAL = REGISTRY.counter(
+    "llm_tokens_total", "LLM消耗的token数，type=cached 为提示词中命中服务端上下文缓存的部分；提前停止的流式调用为估算值",
+    labels=("model", "type")
+)
+
+
+def record_llm_call(model: str, seconds: Optional[float], outcome: str, usage: Optional[Dict[str, int]] = None):
+    """记录一次LLM调用；命中缓存时 seconds 为None，不计入耗时"""
+    LLM_REQUESTS_TOTAL.inc(model=model, outcome=outcome)
+    if seconds is not None:
+        LLM_REQUEST_SECONDS.observe(seconds, model=model)
+    for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        if usage and usage.get(kind):
+            LLM_TOKENS_TOTAL.inc(usage[kind], model=model, type=kind.split("_")[0])
+
+
+class TokenUsage:
+    """
+    一次运行中所有LLM调用的token用量合计，可在多个线程中共享
+
+    cached_tokens 是提示词中命中服务端上下文缓存的部分（包含在 prompt_tokens 中），
+    用于确认共享提示词前缀的效果。提前停止的流式调用没有 usage，计入的是估算值，
+    estimated_calls 为这类调用的次数。
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.estimated_calls = 0
+        self.estimated_prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage: Optional[Dict[str, int]]):
+        """累加一次调用的用量，usage 为None（命中本地缓存或提前停止）时忽略"""
+        if not usage:
+            return
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+            self.cached_tokens += usage.get("cached_tokens") or 0
+            if usage.get("estimated"):
+                self.estimated_calls += 1
+                self.estimated_prompt_tokens += usage.get("prompt_tokens") or 0
+
+    def to_dict(self) -> Dict[str, float]:
+        """cached_ratio 只按服务端返回了用量的调用计算，估算的调用不知道命中缓存的部分"""
+        with self._lock:
+            measured_prompt_tokens = self.prompt_tokens - self.estimated_prompt_tokens
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "estimated_calls": self.estimated_calls,
+                "cached_ratio": round(self.cached_tokens / measured_prompt_tokens, 3) if measured_prompt_tokens else 0.0
+            }
+
+
+class StageTimer:
+    """
+    记录一段流程中各阶段的耗时
+
+    同名阶段多次进入时累加，每次结束同时计入全局的 grading_stage_seconds 直方图。
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.started_at = time.perf_counter()
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def to_dict(self) -> Dict[str, float]:
+        """各阶段耗时和总耗时（秒，保留3位小数）"""
+        timings = {stage: round(seconds, 3) for stage, seconds in self.stages.items()}
+        timings["total"] = round(time.perf_counter() - self.started_at, 3)
+        return timings
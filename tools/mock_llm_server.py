@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List
+
+sys.path.append('.')
+
+from tools.tokens import estimate_tokens, estimate_message_tokens
+
+_FILE_NAME_PATTERN = re.compile(r'文件名: (\S+)')
+_BATCH_GROUP_PATTERN = re.compile(r'^##### (.+?) #####$', re.MULTILINE)
+# 模拟服务端上下文缓存的粒度：提示词按固定长度分块，前缀相同的完整分块才能命中
+PREFIX_CACHE_BLOCK_CHARS = 256
+
+
+def classify_prompt(prompt: str) -> str:
+    """根据提示词判断请求属于哪个阶段：grouping / batch / summary / reask / single"""
+    if '请不要重新批改' in prompt:
+        return "reask"
+    if '请按照以下格式返回分组结果' in prompt:
+        return "grouping"
+    if '一次性批改' in prompt:
+        return "batch"
+    if '另一位老师' in prompt:
+        return "summary"
+    return "single"
+
+
+class MockLLMServer:
+    """
+    本地的OpenAI兼容 chat.completions 服务，用于在不消耗真实额度的情况下测量批改流程的性能
+
+    按提示词类型返回格式正确的固定回复，响应时间服从对数正态分布，
+    可以按比例注入 500 错误、带 Retry-After 的 429 限流，以及缺少分数的单题评分回复。
+    usage 中的 prompt_tokens_details.cached_tokens 模拟服务端的前缀缓存：与之前请求相同的提示词前缀视为命中。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 800.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        malformed_rate: float = 0.0,
+        explanation_chars: int = 0,
+        chunk_interval_ms: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动选择空闲端口
+            latency_ms: 响应时间的中位数（毫秒）
+            latency_sigma: 响应时间对数正态分布的sigma，0表示固定延迟
+            error_rate: 返回 500 错误的比例
+            rate_limit_rate: 返回 429 限流的比例
+            retry_after: 429 响应中 Retry-After 头的秒数
+            malformed_rate: 单题评分回复中漏掉分数的比例，用于测试追问
+            explanation_chars: 单题评分回复在评分标签之后附加的解释文字长度，模拟模型写完分数后继续输出
+            chunk_interval_ms: 流式响应中相邻两块之间的间隔（毫秒），模拟逐token生成
+            seed: 随机数种子，便于复现
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.explanation_chars = explanation_chars
+        self.chunk_interval_ms = chunk_interval_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self.rate_limited = 0
+        self.streams_closed_early = 0
+        self.connections = 0
+        self._prefix_blocks = set()
+        self.latencies: List[float] = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """各类请求数、注入的错误数和限流数，以及客户端建立的TCP连接数"""
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "streams_closed_early": self.streams_closed_early,
+                "connections": self.connections
+            }
+
+    def _draw(self):
+        """为一次请求抽取延迟（秒）和注入的故障"""
+        with self._lock:
+            latency = self.latency_ms / 1000
+            if self.latency_sigma > 0:
+                latency *= self._random.lognormvariate(0, self.latency_sigma)
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return latency, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return latency, 500
+        return latency, 200
+
+    def _cached_prefix_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """按分块统计与之前请求相同的提示词前缀长度（token），并记录本次请求的前缀"""
+        text = "".join(f"<{message.get('role')}>{message.get('content') or ''}" for message in messages)
+        block = PREFIX_CACHE_BLOCK_CHARS
+        cached_chars = 0
+        matching = True
+        running = hashlib.sha1()
+        with self._lock:
+            for end in range(block, len(text) + 1, block):
+                running.update(text[end - block:end].encode('utf-8'))
+                key = running.digest()
+                if matching and key in self._prefix_blocks:
+                    cached_chars = end
+                else:
+                    matching = False
+                    self._prefix_blocks.add(key)
+        return estimate_tokens(text[:cached_chars]) if cached_chars else 0
+
+    def _reply(self, kind: str, prompt: str, json_output: bool = False) -> str:
+        grade_scale = '评级' in prompt
+        with self._lock:
+            score = self._random.choice("AAB") if grade_scale else str(self._random.randint(85, 95))
+            malformed = kind == "single" and self._random.random() < self.malformed_rate
+        if kind == "grouping":
+            names = _FILE_NAME_PATTERN.findall(prompt)
+            return "\n".join(
+                f"[<question>q{i + 1}</question>, <files>[{name}]</files>]" for i, name in enumerate(names)
+            )
+        if kind == "batch":
+            groups = _BATCH_GROUP_PATTERN.findall(prompt)
+            lines = [
+                f"[<group>{group}</group>,<question>{i + 1}</question>,<score>{score}</score>]"
+                for i, group in enumerate(groups)
+            ]
+            return "\n".join(lines) + "\n<summary>各题完成情况良好，代码结构清晰。</summary>"
+        if kind == "summary":
+            return "批改结果合理。各题完成情况良好，代码结构清晰。"
+        if malformed:
+            return "这份作业对应第1题，代码完成情况良好。" if not json_output else '{"question": 1}'
+        explanation = ""
+        if self.explanation_chars > 0:
+            sentence = "代码结构清晰，输入输出处理正确，边界情况考虑较完整。"
+            explanation = "\n" + (sentence * (self.explanation_chars // len(sentence) + 1))[:self.explanation_chars]
+        if json_output:
+            return json.dumps({"question": 1, "score": score}) + explanation
+        return f"[<question>1</question>,<score>{score}</score>]" + explanation
+
+    def _send_json(self, handler, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handle(self, handler):
+        if not handler.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(handler, 404, {"error": {"message": f"未知路径: {handler.path}"}})
+            return
+        length = int(handler.headers.get("Content-Length") or 0)
+        params = json.loads(handler.rfile.read(length) or b"{}")
+        messages = params.get("messages") or []
+        prompt = messages[-1].get("content", "") if messages else ""
+        kind = classify_prompt(prompt)
+
+        latency, status = self._draw()
+        time.sleep(latency)
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.latencies.append(latency)
+            if status == 429:
+                self.rate_limited += 1
+            elif status == 500:
+                self.errors += 1
+
+        if status == 429:
+            self._send_json(handler, 429, {"error": {"message": "请求过于频繁（模拟）", "type": "rate_limit"}},
+                            {"Retry-After": str(self.retry_after)})
+            return
+        if status == 500:
+            self._send_json(handler, 500, {"error": {"message": "服务端错误（模拟）", "type": "server_error"}})
+            return
+
+        json_output = (params.get("response_format") or {}).get("type") == "json_object"
+        content = self._reply(kind, prompt, json_output)
+        prompt_tokens = estimate_message_tokens(messages)
+        completion_tokens = estimate_tokens(content)
+        completion_id = "chatcmpl-mock-" + uuid.uuid4().hex[:12]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": min(prompt_tokens, self._cached_prefix_tokens(messages))}
+        }
+        model = params.get("model", "mock")
+
+        if not params.get("stream"):
+            # 非流式响应同样要等全部内容生成完
+            if self.chunk_interval_ms > 0:
+                time.sleep(self.chunk_interval_ms / 1000 * max(0, (len(content) - 1) // 8))
+            self._send_json(handler, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        # 流式响应：按 SSE 格式分块发送，最后一块带 usage
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        try:
+            self._send_stream(handler, pieces, completion_id, model, usage)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端收到需要的内容后提前关闭了连接
+            with self._lock:
+                self.streams_closed_early += 1
+        handler.close_connection = True
+
+    def _send_stream(self, handler, pieces: List[str], completion_id: str, model: str, usage: Dict[str, int]):
+        for i, piece in enumerate(pieces):
+            if i and self.chunk_interval_ms > 0:
+                time.sleep(self.chunk_interval_ms / 1000)
+            last = i == len(pieces) - 1
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": piece},
+                    "finish_reason": "stop" if last else None
+                }],
+                **({"usage": usage} if last else {})
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动本地的模拟LLM服务（OpenAI兼容接口）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口（默认：8000）")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="响应时间中位数，毫秒（默认：800）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="响应时间对数正态分布的sigma（默认：0.5）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429限流的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="单题评分回复漏掉分数的比例")
+    parser.add_argument("--explanation-chars", type=int, default=0, help="单题评分标签之后附加的解释文字长度")
+    parser.add_argument("--chunk-interval-ms", type=float, default=0.0, help="流式响应相邻两块的间隔，毫秒")
+    parser.add_argument("--seed", type=int, help="随机数种子")
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        explanation_chars=args.explanation_chars,
+        chunk_interval_ms=args.chunk_interval_ms,
+        seed=args.seed
+    )
+    print(f"模拟LLM服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"请求统计: {server.stats()}")
+
+if __name__ == "__main__":
+    main()
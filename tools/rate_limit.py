@@ -0,0 +1,327 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional, Callable, Awaitable, Any, List, Tuple
+
+import openai
+
+# 可以重试的HTTP状态码：请求超时、冲突、限流和服务端错误
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    令牌桶，按每分钟的速率补充令牌
+
+    reserve 直接扣除令牌（允许欠账）并返回需要等待的秒数，
+    调用方自行 sleep，因此同一个桶可以同时用于线程和协程。
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """扣除 amount 个令牌，返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def adjust(self, delta: float):
+        """请求完成后按实际用量修正（delta 为实际用量减去预估用量）"""
+        with self._lock:
+            self._refill()
+            self.tokens -= delta
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 并发控制：每次成功后并发上限加 1/上限（约每轮加1），不超过 maximum；
+    遇到限流时上限减半，最低不低于 minimum
+
+    同一个实例可以同时用于线程（acquire）和协程（aacquire），释放名额时两边的等待者都会被唤醒。
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: Optional[int] = None):
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        # 等待名额的协程：(所在事件循环, 释放名额时完成的Future)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def aacquire(self):
+        # 不能在事件循环线程中阻塞等待，登记一个Future，释放名额时由 release 唤醒后重新检查
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._cond:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def release(self, throttled: bool = False, success: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif success:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应的 Retry-After / retry-after-ms 头中读取建议的等待时间"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+class RequestThrottle:
+    """
+    一次批改运行中所有LLM请求共享的流量控制
+
+    - 每分钟请求数 / token数的令牌桶限速
+    - AIMD 自适应并发：被限流时减半，成功时逐步放大
+    - 可重试的错误（429、5xx、连接错误）按带抖动的指数退避重试，优先遵循 Retry-After
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        initial_concurrency: int = 16,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+    ):
+        """
+        Args:
+            requests_per_minute: 每分钟请求数上限，None表示不限制
+            tokens_per_minute: 每分钟token数上限，None表示不限制
+            initial_concurrency: 同时进行的请求数的初始上限
+            max_concurrency: 请求一直成功时并发上限最多放大到的值，应不大于LLM连接池的大小
+            min_concurrency: 被限流时并发数的下限
+            max_retries: 最大重试次数
+            base_delay: 退避的基础等待时间（秒）
+            max_delay: 单次退避的最长等待时间（秒）
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(min(initial_concurrency, max_concurrency), min_concurrency,
+                                               max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.retries = 0
+        self.throttled = 0
+        self._stats_lock = threading.Lock()
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None and estimated_tokens:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        return wait
+
+    def _settle(self, response: Any, estimated_tokens: int):
+        """按响应中的实际token用量修正令牌桶"""
+        usage = getattr(response, "usage", None)
+        total_tokens = getattr(usage, "total_tokens", None)
+        if self.token_bucket is not None and total_tokens is not None:
+            self.token_bucket.adjust(total_tokens - estimated_tokens)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """返回重试前需要等待的秒数，不应重试时返回None"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        with self._stats_lock:
+            self.retries += 1
+            if is_throttled(error):
+                self.throttled += 1
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return max(retry_after, backoff)
+        return backoff
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0) -> Any:
+        """
+        在流量控制下调用 fn（同步）
+
+        Args:
+            fn: 发起一次请求的无参函数
+            estimated_tokens: 本次请求预估的token数，用于token限速
+
+        Returns:
+            fn 的返回值
+        """
+        response = self._call(fn, estimated_tokens, hold=False)
+        self._settle(response, estimated_tokens)
+        return response
+
+    @contextmanager
+    def stream(self, fn: Callable[[], Any], estimated_tokens: int = 0):
+        """
+        在流量控制下发起流式请求，并发名额保持到退出上下文、流被关闭时才释放
+
+        Yields:
+            fn 返回的流
+        """
+        response = self._call(fn, estimated_tokens, hold=True)
+        success = False
+        try:
+            yield response
+            success = True
+        finally:
+            try:
+                response.close()
+            finally:
+                self.concurrency.release(success=success)
+
+    def _call(self, fn: Callable[[], Any], estimated_tokens: int, hold: bool) -> Any:
+        """带限速、并发控制和重试地调用 fn；hold 为True时成功后不释放并发名额，由调用方释放"""
+        attempt = 0
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            self.concurrency.acquire()
+            try:
+                response = fn()
+            except Exception as e:
+                self.concurrency.release(throttled=is_throttled(e))
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            if not hold:
+                self.concurrency.release(success=True)
+            return response
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """call 的异步版本，fn 返回可等待对象"""
+        response = await self._acall(fn, estimated_tokens, hold=False)
+        self._settle(response, estimated_tokens)
+        return response
+
+    @asynccontextmanager
+    async def astream(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0):
+        """stream 的异步版本，fn 返回可等待的流"""
+        response = await self._acall(fn, estimated_tokens, hold=True)
+        success = False
+        try:
+            yield response
+            success = True
+        finally:
+            try:
+                await response.close()
+            finally:
+                self.concurrency.release(success=success)
+
+    async def _acall(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int, hold: bool) -> Any:
+        attempt = 0
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.concurrency.aacquire()
+            try:
+                response = await fn()
+            except Exception as e:
+                self.concurrency.release(throttled=is_throttled(e))
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            if not hold:
+                self.concurrency.release(success=True)
+            return response
+
+    def stats(self):
+        """返回重试次数、被限流次数和当前并发上限"""
+        with self._stats_lock:
+            return {
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "concurrency_limit": int(self.concurrency.limit)
+            }
@@ -0,0 +1,199 @@
+import csv
+import json
+import os
+from typing import Dict, Any, List, Optional, Sequence
+
+CSV_FIELDS = ['学号', '姓名', '得分', '作业情况']
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+def csv_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """评分结果对应的CSV行"""
+    return {
+        '学号': result['student_id'],
+        '姓名': result['student_name'],
+        '得分': result['score'],
+        '作业情况': result['feedback']
+    }
+
+
+def result_record(zip_file: str, result: Dict[str, Any], path: Optional[str] = None) -> Dict[str, Any]:
+    """评分结果对应的 JSONL / Parquet 记录，包含ZIP文件的相对路径和每题的题号和分数"""
+    return {
+        "zip_file": zip_file,
+        "path": path or zip_file,
+        "student_id": result["student_id"],
+        "student_name": result["student_name"],
+        "score": str(result["score"]),
+        "feedback": result["feedback"],
+        "grouping": result.get("grouping"),
+        "duplicates": result.get("duplicates", 0),
+        "questions": [
+            {"group": str(item["group"]), "question": str(item["question"]), "score": str(item["score"])}
+            for item in result.get("questions") or []
+        ]
+    }
+
+
+class CsvResultSink:
+    """逐行追加CSV，每写一名学生就刷新到磁盘，运行中途即可打开查看"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+        self._writer.writeheader()
+        self._file.flush()
+
+    def write(self, zip_file: str, result: Dict[str, Any], path: Optional[str] = None):
+        self._writer.writerow(csv_row(result))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlResultSink:
+    """每名学生一行JSON，包含每题得分"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, zip_file: str, result: Dict[str, Any], path: Optional[str] = None):
+        self._file.write(json.dumps(result_record(zip_file, result, path), ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetResultSink:
+    """
+    Parquet 输出，需要安装 pyarrow
+
+    Parquet 文件的元数据在关闭时才写入，因此按 row_group_size 名学生一组写出，
+    运行中途的文件不完整，运行结束后才能读取。
+    """
+
+    def __init__(self, path: str, row_group_size: int = 100):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("输出 Parquet 需要安装 pyarrow：pip install pyarrow")
+        self.path = path
+        self.row_group_size = row_group_size
+        self._pa = pa
+        self._schema = pa.schema([
+            ("zip_file", pa.string()),
+            ("path", pa.string()),
+            ("student_id", pa.string()),
+            ("student_name", pa.string()),
+            ("score", pa.string()),
+            ("feedback", pa.string()),
+            ("grouping", pa.string()),
+            ("duplicates", pa.int32()),
+            ("questions", pa.list_(pa.struct([
+                ("group", pa.string()),
+                ("question", pa.string()),
+                ("score", pa.string())
+            ])))
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._pending: List[Dict[str, Any]] = []
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write_table(self._pa.Table.from_pylist(self._pending, schema=self._schema))
+            self._pending = []
+
+    def write(self, zip_file: str, result: Dict[str, Any], path: Optional[str] = None):
+        self._pending.append(result_record(zip_file, result, path))
+        if len(self._pending) >= self.row_group_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+_SINKS = {
+    "csv": CsvResultSink,
+    "jsonl": JsonlResultSink,
+    "parquet": ParquetResultSink
+}
+
+
+class ResultStreamWriter:
+    """
+    评分结果的增量输出：每名学生批改完成后立即写入所有输出文件
+
+    各文件按完成顺序写入；CSV 在 finalize 时按学生顺序重写一次，与一次性保存的结果一致。
+    """
+
+    def __init__(self, csv_path: str, formats: Sequence[str] = ("csv",)):
+        """
+        Args:
+            csv_path: CSV 文件路径，其他格式使用相同的文件名、不同的扩展名
+            formats: 输出格式，取值见 OUTPUT_FORMATS
+        """
+        unknown = [fmt for fmt in formats if fmt not in OUTPUT_FORMATS]
+        if unknown:
+            raise ValueError(f"未知的输出格式: {', '.join(unknown)}")
+        stem = os.path.splitext(csv_path)[0]
+        self.paths = {fmt: csv_path if fmt == "csv" else f"{stem}.{fmt}" for fmt in formats}
+        self._sinks = []
+        try:
+            for fmt in formats:
+                self._sinks.append(_SINKS[fmt](self.paths[fmt]))
+        except Exception:
+            self.close()
+            raise
+
+    def write(self, zip_file: str, result: Dict[str, Any], path: Optional[str] = None):
+        """写入一名学生的结果，path 为ZIP文件相对于搜索目录的路径，用于合并时排序"""
+        for sink in self._sinks:
+            sink.write(zip_file, result, path)
+
+    def close(self):
+        for sink in self._sinks:
+            sink.close()
+        self._sinks = []
+
+    def finalize(self, results: List[Optional[Dict[str, Any]]]):
+        """关闭所有输出，并按 results 的顺序重写CSV"""
+        self.close()
+        csv_path = self.paths.get("csv")
+        if csv_path is not None:
+            tmp_path = csv_path + ".tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
+                writer.writeheader()
+                for result in results:
+                    if result is not None:
+                        writer.writerow(csv_row(result))
+            os.replace(tmp_path, csv_path)
+
+
+def merge_record_files(fmt: str, input_files: Sequence[str], output_file: str):
+    """合并多个 JSONL 或 Parquet 结果文件并按ZIP文件的相对路径排序，用于合并各子分片的输出"""
+    if fmt == "jsonl":
+        lines = []
+        for path in input_files:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines.extend(line if line.endswith("\n") else line + "\n" for line in f if line.strip())
+        lines.sort(key=lambda line: json.loads(line)["path"])
+        with open(output_file, 'w', encoding='utf-8') as out:
+            out.writelines(lines)
+    elif fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("合并 Parquet 需要安装 pyarrow：pip install pyarrow")
+        tables = [pq.read_table(path) for path in input_files]
+        if tables:
+            pq.write_table(pa.concat_tables(tables).sort_by("path"), output_file)
+    else:
+        raise ValueError(f"不支持合并的输出格式: {fmt}")
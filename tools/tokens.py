@@ -0,0 +1,144 @@
+from typing import Dict, List, Iterable
+import math
+import re
+
+from tools.local_grouping import strip_cpp_comments
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+_FILE_HEADER_PATTERN = re.compile(r'^//=== (.+?) ===$', re.MULTILINE)
+_OMITTED_PREFIX = "// （与 "
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估计文本的token数
+
+    中文字符和全角标点约1个token，其余字符（代码、英文）约3.5个字符1个token。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 3.5)
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """估计对话消息的token数，每条消息另加少量格式开销"""
+    return sum(estimate_tokens(message.get("content") or "") for message in messages) + 4 * len(messages)
+
+
+def split_file_blocks(content: str) -> List[List[str]]:
+    """把合并后的分组内容拆成 [文件名, 内容] 列表，没有文件头的部分文件名为空"""
+    blocks = []
+    headers = list(_FILE_HEADER_PATTERN.finditer(content))
+    if not headers or headers[0].start() > 0:
+        prefix = content[:headers[0].start()] if headers else content
+        if prefix.strip():
+            blocks.append(["", prefix])
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(content)
+        blocks.append([header.group(1), content[header.end():end]])
+    return blocks
+
+
+def join_file_blocks(blocks: List[List[str]]) -> str:
+    return "".join(f"//=== {name} ===" + body if name else body for name, body in blocks)
+
+
+def compact_code(code: str) -> str:
+    """去除注释、行首缩进、行尾空白和空行"""
+    lines = (line.strip() for line in strip_cpp_comments(code).splitlines())
+    return "\n".join(line for line in lines if line) + "\n"
+
+
+def _compact_group(content: str) -> str:
+    """逐个文件压缩分组内容，保留文件头和省略说明"""
+    blocks = split_file_blocks(content)
+    for block in blocks:
+        if not block[1].lstrip().startswith(_OMITTED_PREFIX):
+            block[1] = "\n" + compact_code(block[1])
+    return join_file_blocks(blocks)
+
+
+def truncate_to_tokens(code: str, max_tokens: int) -> str:
+    """保留开头尽可能多的整行，使估计token数不超过 max_tokens"""
+    if estimate_tokens(code) <= max_tokens:
+        return code
+    lines = code.splitlines()
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept) + f"\n// ...（超出长度限制，省略 {len(lines) - len(kept)} 行）\n"
+
+
+def fit_groups_to_budget(groups: Dict[str, str], max_tokens: int, keep: Iterable[str] = ()) -> Dict[str, str]:
+    """
+    压缩各分组的代码，使总估计token数不超过预算
+
+    依次尝试，满足预算即停止：
+    1. 有依赖关系的题目会重复包含前面题目的文件，重复的文件只保留第一次出现
+    2. 去除不在 keep 中的分组的注释和空白，再去除 keep 中分组的
+    3. 按比例截断不在 keep 中的分组，仍超出时再截断 keep 中的分组
+
+    Args:
+        groups: 组名到合并后代码的映射
+        max_tokens: token预算
+        keep: 需要尽量保留原样的组名（如得分较低、需要在总结中说明的题目）
+
+    Returns:
+        压缩后的分组，组名和顺序不变
+    """
+    def total(current):
+        return sum(estimate_tokens(content) for content in current.values())
+
+    if total(groups) <= max_tokens:
+        return dict(groups)
+
+    keep = set(keep)
+    # 1. 去除重复文件
+    seen = {}
+    fitted = {}
+    for name, content in groups.items():
+        blocks = split_file_blocks(content)
+        for block in blocks:
+            file_name, body = block
+            if not file_name:
+                continue
+            fingerprint = (file_name, body)
+            if fingerprint in seen:
+                block[1] = f"\n{_OMITTED_PREFIX}{seen[fingerprint]} 中的同名文件相同，省略）\n\n"
+            else:
+                seen[fingerprint] = name
+        fitted[name] = join_file_blocks(blocks)
+    if total(fitted) <= max_tokens:
+        return fitted
+
+    # 2. 去除注释和空白
+    for protected in (False, True):
+        for name in fitted:
+            if (name in keep) == protected:
+                fitted[name] = _compact_group(fitted[name])
+        if total(fitted) <= max_tokens:
+            return fitted
+
+    # 3. 截断：先按比例截断未保留的分组，不够时再截断保留的分组
+    kept_tokens = sum(estimate_tokens(fitted[name]) for name in fitted if name in keep)
+    others = [name for name in fitted if name not in keep]
+    other_budget = max(0, max_tokens - kept_tokens)
+    other_tokens = sum(estimate_tokens(fitted[name]) for name in others)
+    for name in others:
+        share = estimate_tokens(fitted[name]) / other_tokens if other_tokens else 0
+        fitted[name] = truncate_to_tokens(fitted[name], int(other_budget * share))
+    if total(fitted) <= max_tokens:
+        return fitted
+
+    kept = [name for name in fitted if name in keep]
+    kept_budget = max(0, max_tokens - sum(estimate_tokens(fitted[name]) for name in others))
+    for name in kept:
+        share = estimate_tokens(fitted[name]) / kept_tokens if kept_tokens else 0
+        fitted[name] = truncate_to_tokens(fitted[name], int(kept_budget * share))
+    return fitted